@@ -1,9 +1,19 @@
 import numpy as np
 import pandas as pd
 from scipy import stats
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 import objectpath
 
+from . import ingest, persist
+from .bootstrap import bootstrap_many
+from .index import StudyIndex
+from .lazy import LazyQuery
+from .online import OnlineStats
+from .query import compile_query
+from .summary import summarize, summarize_groups
+from .store import (BiomarkerColumns, Categories, CODE_FIELDS, DAY, DTYPES, KEY_FIELDS, OFFSETS, TIME_DTYPE, as_columns, assert_unique,
+                    FrameBuffer, first_rows, frame, frame_columns, group_rows, row_hashes, _to_times)
+
 
 @dataclass
 class Biomarker:
@@ -40,7 +50,7 @@ class Biomarker:
     def _baseline_time(cls, targeted_date, time):
 
         delta = np.datetime64(time) - np.datetime64(targeted_date)
-        return delta.astype('d')
+        return delta / DAY
 
     def _update(self, key, value):
 
@@ -54,38 +64,121 @@ class Participant:
     name: str
 
     def __post_init__(self):
-        setattr(self, 'biomarkers', dict())
-        setattr(self, 'biomarkers_class', dict())
-        self.biomarker_keys = self.biomarkers_class.keys()
+        setattr(self, 'store', dict())
+        setattr(self, 'categories', {field: Categories() for field in CODE_FIELDS})
+        setattr(self, 'version', 0)
+        setattr(self, '_cache', dict())
+        setattr(self, 'studies', list())
+        self.biomarker_keys = self.store.keys()
 
     def _add_measurement(self, marker):
 
-        ## check to see if biomarker already in dict
-        if marker.name in self.biomarkers.keys():
+        ## check to see if biomarker already in store
+        if marker.name in self.store.keys():
             # ensure that the participant name matches
             assert (marker.participant == self.name), f'participant {marker.participant} does not match {self.name}'
 
-            # ensure only unique biomarkers are added
-            for biomark in self.biomarkers_class.get(marker.name):
-                assert (marker != biomark), 'biomarker exists'
+            # ensure only unique biomarkers are added; the key hash is shared with the append
+            row_hash = self.store.get(marker.name).marker_hash(marker)
+            assert (self.store.get(marker.name).find(marker, row_hash).size == 0), 'biomarker exists'
 
-            ## old data point
-            bm_v = self.biomarkers.get(marker.name)
-            bm_v_cl = self.biomarkers_class.get(marker.name)
+        else:
+            # new column block for this biomarker name
+            self.store.update({marker.name: BiomarkerColumns(marker.name, self.categories)})
+            row_hash = None
 
-            ## set new value
-            self.biomarkers[marker.name] = bm_v.__add__([asdict(marker)])
-            self.biomarkers_class[marker.name] = bm_v_cl.__add__([marker])
+        row = self.store.get(marker.name).append(marker, row_hash)
+        self._changed(marker.name, row, row + 1)
 
+        return self
+
+    def _extend(self, name, columns, row_hash=None, check=True, notify=True):
+        if name in self.store.keys():
+            start = self.store.get(name).size
+            self.store.get(name).extend(columns, row_hash=row_hash, check=check)
         else:
-            # update the biomarkers dict with a new key
-            self.biomarkers.update({marker.name: [asdict(marker)]})
-            self.biomarkers_class.update({marker.name: [marker]})
+            start = 0
+            self.store.update({name: BiomarkerColumns(name, self.categories, columns=columns)})
+
+        return self._changed(name, start, self.store.get(name).size, notify=notify)
+
+    def _changed(self, name, start, stop, notify=True):
+        # rows [start, stop) of the name block are new; let owning studies update derived state
+        self.version += 1
+        if notify:
+            for study in self.studies:
+                study._added_rows([(self, name, start, stop)])
+        return (self, name, start, stop)
+
+    def add_measurements(self, data):
+        # bulk ingest of a long-format frame or mapping of arrays for this participant
+        columns = as_columns(data, participant=self.name)
+        assert (columns['participant'] == self.name).all(), f'participant does not match {self.name}'
+
+        for field in CODE_FIELDS:
+            columns[field] = self.categories[field].encode_many(columns[field])
+        names = Categories()
+        name_codes = names.encode_many(columns.pop('name'))
+        assert_unique(dict(columns, name=name_codes), list(columns.keys()) + ['name'])
+
+        order, starts, stops = group_rows(name_codes)
+        columns = {field: column[order] for field, column in columns.items()}
+        changes = [self._extend(names.labels[name_codes[order[start]]],
+                                {field: column[start:stop] for field, column in columns.items()}, notify=False)
+                   for start, stop in zip(starts, stops)]
+        for study in self.studies:
+            study._added_rows(changes)
+
+        return self
 
+    def _first_time(self):
+        # earliest measurement over every biomarker
+        times = [block.column('time') for block in self.store.values() if block.size]
+        times = np.concatenate(times) if times else np.empty(0, dtype=TIME_DTYPE)
+        times = times[~np.isnat(times)]
+        return times.min() if times.size else np.datetime64('NaT')
+
+    def rebaseline(self, enrolled_date=None, targeted_date=None, notify=True):
+        # recompute both baseline offset columns in place. a date argument replaces the
+        # stored date first: a date, or 'first' for this participant's first measurement
+        for field, anchor in (('enrolled_date', enrolled_date), ('targeted_date', targeted_date)):
+            if isinstance(anchor, str) and anchor == 'first':
+                anchor = self._first_time()
+            elif anchor is not None:
+                anchor = _to_times([anchor])[0]
+            for block in self.store.values():
+                block.rebase(field, anchor)
+
+        self.version += 1
+        if notify:
+            for study in self.studies:
+                study._rebased([self])
         return self
 
+    def _cached(self, key, build):
+        # rebuild derived views only when the store has changed
+        version, value = self._cache.get(key, (None, None))
+        if version != self.version:
+            value = build()
+            self._cache.update({key: (self.version, value)})
+        return value
+
+    @property
+    def biomarkers(self):
+        return self._cached('biomarkers', lambda: {x: self.store[x].records() for x in self.store.keys()})
+
+    @property
+    def biomarkers_class(self):
+        return self._cached('biomarkers_class', lambda: {
+            x: [Biomarker(**record) for record in self.biomarkers[x]] for x in self.store.keys()})
+
     def bio_query(self, query, _class=False):
 
+        # common shapes run as compiled filters over the column blocks
+        plan = None if _class else compile_query(query)
+        if plan is not None:
+            return plan.run([self.store[plan.name]] if plan.name in self.store.keys() else [])
+
         # get biomarker data
         if _class:
             tree = objectpath.Tree(self.biomarkers_class)
@@ -96,8 +189,8 @@ class Participant:
         return tuple(tree.execute(query))
 
     def as_dataframe(self):
-        df_list = [pd.DataFrame(self.biomarkers[x]) for x in list(self.biomarker_keys)]
-        return pd.concat(df_list)
+        # cached until the next measurement is added; a shallow copy keeps edits out of the cache
+        return self._cached('dataframe', lambda: frame([(x, 0, x.size) for x in self.store.values()])).copy(deep=False)
 
 
 @dataclass
@@ -105,51 +198,332 @@ class Study:
     name: str
 
     def __post_init__(self):
-        setattr(self, 'data', dict())
         setattr(self, 'participants', dict())
         setattr(self, 'participants_class', dict())
-        self.data = self.data
-        self.member_keys = self.data.keys()
+        setattr(self, 'categories', {field: Categories() for field in CODE_FIELDS})
+        setattr(self, 'index', None)
+        setattr(self, 'version', 0)
+        setattr(self, '_frame', None)
+        setattr(self, '_buffer', None)
+        setattr(self, '_pending', list())
+        setattr(self, '_spans', list())
+        self.member_keys = self.participants.keys()
 
         return self
 
+    def _new_participant(self, name):
+        # participant whose labels are encoded with the study wide categories
+        part = Participant(name)
+        part.categories = self.categories
+        return part
+
+    def save(self, path):
+        # columnar .npy per field and biomarker plus a json manifest, see persist.py
+        return persist.save(self, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        return persist.load(cls, path, mmap=mmap)
+
+    @classmethod
+    def from_dataframe(cls, name, data):
+        # bulk constructor from a long-format frame (or mapping of arrays) with
+        # participant, name, value and optional time/description/arm/date columns
+        study = cls(name)
+        columns = as_columns(data)
+        for field in CODE_FIELDS:
+            columns[field] = study.categories[field].encode_many(columns[field])
+        names = Categories()
+        name_codes = names.encode_many(columns.pop('name'))
+        return study._extend_columns(columns, names, name_codes)
+
+    @classmethod
+    def from_files(cls, name, paths, workers=None, chunk_bytes=ingest.CHUNK_BYTES, rename=None):
+        # streaming CSV / Parquet reader, pieces parsed across a process pool, see ingest.py
+        return ingest.load(cls, name, paths, workers=workers, chunk_bytes=chunk_bytes, rename=rename)
+
+    def upsert(self, data):
+        # incremental merge of new readings (e.g. a daily lab feed): rows equal to a stored
+        # reading, or repeated within data, are dropped and the rest appended to existing or
+        # new participants. only blocks that receive rows change, and derived state (index,
+        # cached frames) follows those rows through _added_rows
+        columns = as_columns(data)
+        for field in CODE_FIELDS:
+            columns[field] = self.categories[field].encode_many(columns[field])
+        names = Categories()
+        name_codes = names.encode_many(columns.pop('name'))
+        return self._extend_columns(columns, names, name_codes, dedupe=True)
+
+    def _extend_columns(self, columns, names, name_codes, dedupe=False):
+        # typed columns with codes in the study categories; rows are grouped by
+        # (participant, name) and each group lands in one block extend
+        if dedupe:
+            # a reading is keyed on (participant, name, time, value): a re-delivered reading
+            # is dropped even when its other fields (arm, dates, baselines) have changed since
+            keep = first_rows(dict(columns, name=name_codes), KEY_FIELDS + ('name',))
+            columns = {field: column[keep] for field, column in columns.items()}
+            name_codes = name_codes[keep]
+        else:
+            assert_unique(dict(columns, name=name_codes), list(columns.keys()) + ['name'])
+
+        order, starts, stops = group_rows(columns['participant'], name_codes)
+        # a participant's names are added in order of their first reading, as per reading ingest
+        groups = np.lexsort((order[starts], columns['participant'][order[starts]]))
+        starts, stops = starts[groups], stops[groups]
+        columns = {field: column[order] for field, column in columns.items()}
+        name_codes = name_codes[order]
+        # row hashes for block dedupe, computed once for the whole batch
+        row_hash = row_hashes(columns, KEY_FIELDS) if dedupe else None
+
+        labels = self.categories['participant'].labels
+        changes = []
+        for start, stop in zip(starts, stops):
+            part_name = labels[columns['participant'][start]]
+            if part_name not in self.participants_class.keys():
+                self._add_participant(self._new_participant(part_name))
+            part = self.participants_class[part_name][0]
+            name = names.labels[name_codes[start]]
+            group = {field: column[start:stop] for field, column in columns.items()}
+            group_hash = None if row_hash is None else row_hash[start:stop]
+
+            if part.categories is not self.categories:
+                # participant added with its own label codes
+                for field in CODE_FIELDS:
+                    group[field] = part.categories[field].encode_many(self.categories[field].decode(group[field]))
+                group_hash = None if row_hash is None else row_hashes(group, KEY_FIELDS)
+            block = part.store.get(name)
+            if dedupe and block is not None and block.size:
+                new = ~block.stored(group, group_hash, fields=KEY_FIELDS)
+                if not new.all():
+                    group = {field: column[new] for field, column in group.items()}
+                    group_hash = group_hash[new]
+            if len(group['value']):
+                # deduped rows are new by construction, so the block skips its own checks
+                changes.append(part._extend(name, group, row_hash=group_hash, check=not dedupe, notify=False))
+
+        # derived state of every owning study follows the new rows in one batch
+        studies = dict()
+        for change in changes:
+            for study in change[0].studies:
+                studies.setdefault(id(study), (study, []))[1].append(change)
+        for study, study_changes in studies.values():
+            study._added_rows(study_changes)
+        return self
+
+    @property
+    def data(self):
+        # participant biomarker records, built from the columnar stores on demand
+        return {x: [self.participants[x][0].biomarkers] for x in self.participants.keys()}
+
     def _add_participant(self, Participant):
-        # ensure that the participant name matches
-        # ensure only unique participants are added
+        # new participants are registered, known ones have their readings merged
         if Participant.name in self.participants_class.keys():
-            print(f'participant {Participant.name} exists in {self.name}')
-            pass
+            # merge the readings of an already known participant, skipping stored ones
+            if Participant is not self.participants_class[Participant.name][0]:
+                self.upsert(Participant.as_dataframe())
         else:
-            self.data.update({Participant.name: [Participant.biomarkers]})
             self.participants.update({Participant.name: [Participant]})
             self.participants_class.update({Participant.name: [Participant]})
+            Participant.studies.append(self)
+            if self.index is not None:
+                self.index.add_participant(Participant)
+            self.version += 1
+            if self._frame is not None:
+                self._pending.extend((block, 0, block.size) for block in Participant.store.values())
 
         return self
 
+    def _added_rows(self, changes):
+        # changes: (participant, name, start, stop) for rows [start, stop) new in those blocks
+        if self.index is not None:
+            self.index.add_rows(changes)
+        self.version += 1
+        if self._frame is not None:
+            self._pending.extend((part.store.get(name), start, stop) for part, name, start, stop in changes)
+        return self
+
+    def rebaseline(self, participants=None, enrolled_date=None, targeted_date=None):
+        # corrected or alternate anchors for the baseline offsets of the given participants
+        # (all by default). each date argument is None (keep the stored dates, recompute the
+        # offsets), a date or 'first' for every participant, or a mapping participant -> date
+        # or 'first'; participants defaults to the mapping's keys when one is given
+        if participants is None:
+            mappings = [x for x in (enrolled_date, targeted_date) if isinstance(x, dict)]
+            participants = list(dict.fromkeys(k for x in mappings for k in x)) if mappings else list(self.participants.keys())
+
+        parts = []
+        for part_name in participants:
+            anchors = [x.get(part_name) if isinstance(x, dict) else x for x in (enrolled_date, targeted_date)]
+            part = self.participants_class[part_name][0]
+            part.rebaseline(*anchors, notify=False)
+            parts.append(part)
+
+        studies = {id(study): study for part in parts for study in part.studies}
+        for study in studies.values():
+            study._rebased(parts)
+        return self
+
+    def _rebased(self, parts):
+        # offsets (and maybe dates) were rewritten in place: re-key those participants in the
+        # baseline range indexes and rebuild the cached frame on next use
+        if self.index is not None:
+            self.index.refresh(parts, fields=tuple(OFFSETS.values()))
+        self.version += 1
+        setattr(self, '_frame', None)
+        self._pending.clear()
+        return self
+
     def _add_participants(self, list_of_part):
         for part in list_of_part:
             self._add_participant(part)
 
         return self
 
+    def _compiled(self, query):
+        # plans only cover $..<name> lookups that cannot also match a participant key
+        plan = compile_query(query)
+        if plan is None or plan.dots != '..' or plan.name in self.participants.keys():
+            return None
+        return plan
+
     def bio_query(self, query, as_dataframe=False, override=False):
-        # get biomarker data
-        if override:
-            tree = objectpath.Tree(override)
+        plan = None if override else self._compiled(query)
+        if plan is not None:
+            blocks = [part[0].store[plan.name] for part in self.participants.values()
+                      if plan.name in part[0].store.keys()]
+            result = plan.run(blocks)
+
         else:
-            tree = objectpath.Tree(self.data)
+            # get biomarker data
+            if override:
+                tree = objectpath.Tree(override)
+            else:
+                tree = objectpath.Tree(self.data)
+            result = tuple(tree.execute(query))
 
         if as_dataframe:
-            return pd.DataFrame(tuple(tree.execute(query)))
+            return pd.DataFrame(result)
+
+        else:
+            return result
+
+    def _indexed(self):
+        if self.index is None:
+            setattr(self, 'index', StudyIndex.build([x[0] for x in self.participants.values()]))
+        return self.index
+
+    def lazy(self):
+        # deferred where/select/agg query, optimized and run in one pass at collect()
+        return LazyQuery(self)
+
+    def select(self, name=None, arm=None, time_range=None, on='time'):
+        # indexed lookup of readings by biomarker name, arm and an inclusive [low, high]
+        # range on time (or on a baseline offset in days via on=...)
+        matches = self._indexed().lookup(name=name, arm=arm, time_range=time_range, on=on)
+        return pd.DataFrame(self.index.gather(matches))
+
+    def _columns(self, fields, by):
+        # raw study wide columns straight from the blocks, plus (codes, labels) per `by` field
+        blocks = [block for part in self.participants.values() for block in part[0].store.values() if block.size]
+        columns = {field: np.concatenate([block.column(field) for block in blocks] or [np.empty(0, DTYPES[field])])
+                   for field in fields}
+
+        factors = []
+        for field in by:
+            if field == 'name':
+                names = Categories()
+                codes = np.repeat(np.array([names.encode(block.name) for block in blocks], dtype=np.int64),
+                                  [block.size for block in blocks])
+                factors.append((codes, names.labels))
+            else:
+                assert (field in CODE_FIELDS), f'cannot group by {field}'
+                codes = np.concatenate([block.column(field) if block.categories is self.categories
+                                        else self.categories[field].encode_many(block.labels(field)) for block in blocks]
+                                       or [np.empty(0, np.int32)])
+                factors.append((codes.astype(np.int64), self.categories[field].labels))
+        return columns, factors
+
+    def aggregate(self, bins, by=('name', 'arm'), stats=('n', 'mean', 'median'), on='baseline_enrolled_days',
+                  field='value', low=2.5, high=97.5):
+        # longitudinal windows: readings are binned on `on` (offset days, or time) by
+        # searchsorted against the bin edges, then every (by..., bin) group is reduced in
+        # one segmented pass. bins are edges, or a width starting at the smallest value;
+        # readings outside [edges[0], edges[-1]) are left out
+        columns, factors = self._columns((field, on), by)
+        keys = columns[on].view(np.int64) if columns[on].dtype.kind == 'M' else columns[on]
+        if np.ndim(bins) == 0:
+            width = np.timedelta64(bins).astype('timedelta64[ns]').astype(np.int64) if columns[on].dtype.kind == 'M' \
+                else float(bins)
+            valid = keys[~np.isnan(keys)] if keys.dtype.kind == 'f' else keys[keys != np.iinfo(np.int64).min]
+            start = valid.min() if valid.size else 0
+            edges = start + width * np.arange(int((valid.max() - start) // width) + 2 if valid.size else 1)
+        else:
+            edges = np.asarray(bins)
+            edges = edges.astype(TIME_DTYPE).view(np.int64) if edges.dtype.kind == 'M' else edges
 
+        position = np.searchsorted(edges, keys, side='right') - 1
+        inside = (position >= 0) & (position < len(edges) - 1)
+        if keys.dtype.kind == 'f':
+            inside &= ~np.isnan(keys)
         else:
-            return tuple(tree.execute(query))
+            inside &= keys != np.iinfo(np.int64).min
+
+        key = np.zeros(int(inside.sum()), dtype=np.int64)
+        for codes, labels in factors:
+            key = key * len(labels) + codes[inside]
+        key = key * (len(edges) - 1) + position[inside]
+        groups, result = summarize_groups(columns[field][inside], key, low=low, high=high)
+
+        # unpack (by..., bin) from the combined key
+        bin_start = edges[groups % (len(edges) - 1)]
+        bin_end = edges[groups % (len(edges) - 1) + 1]
+        groups = groups // (len(edges) - 1)
+        labels = []
+        for codes, uniques in reversed(factors):
+            labels.insert(0, np.asarray(uniques, dtype=object)[groups % len(uniques)])
+            groups = groups // len(uniques)
+        if columns[on].dtype.kind == 'M':
+            bin_start, bin_end = bin_start.astype(TIME_DTYPE), bin_end.astype(TIME_DTYPE)
+
+        index = pd.MultiIndex.from_arrays(labels + [bin_start], names=list(by) + ['bin'])
+        return pd.DataFrame(dict([('bin_end', bin_end)] + [(stat, result[stat]) for stat in stats]), index=index).sort_index()
 
     def as_dataframe(self):
-        df_list = []
-        for part in self.participants.keys():
-            df_list.append(self.participants[part][0].as_dataframe())
-        return pd.concat(df_list)
+        # materialized once, then only rows added since the last call are appended. the frame
+        # keeps the order of a fresh build (participants, their blocks, block rows) and is only
+        # reordered when new rows land before its end; callers get a shallow copy, so copy on
+        # write keeps their edits out of the cache
+        if self._frame is None:
+            chunks = [(block, 0, block.size) for part in self.participants.values() for block in part[0].store.values()]
+            setattr(self, '_buffer', FrameBuffer().append(frame_columns(chunks)))
+            setattr(self, '_spans', [chunk for chunk in chunks if chunk[2] > chunk[1]])
+            setattr(self, '_frame', self._buffer.frame())
+        elif self._pending:
+            pending = [chunk for chunk in self._pending if chunk[2] > chunk[1]]
+            self._buffer.append(frame_columns(pending))
+            self._spans.extend(pending)
+            setattr(self, '_frame', self._ordered().frame())
+        self._pending.clear()
+        return self._frame.copy(deep=False)
+
+    def _ordered(self):
+        # _spans are the (block, start, stop) row ranges held by the buffer, in buffer order
+        rank = {id(block): i for i, block in enumerate(
+            block for part in self.participants.values() for block in part[0].store.values())}
+        keys = [(rank[id(block)], start) for block, start, _ in self._spans]
+        if all(a < b for a, b in zip(keys, keys[1:])):
+            return self._buffer
+
+        offsets = np.cumsum([0] + [stop - start for _, start, stop in self._spans])
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        setattr(self, '_buffer', self._buffer.take(np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in order])))
+        spans = []
+        for block, start, stop in (self._spans[i] for i in order):
+            if spans and spans[-1][0] is block and spans[-1][2] == start:
+                start = spans.pop()[1]
+            spans.append((block, start, stop))
+        setattr(self, '_spans', spans)
+        return self._buffer
 
 
 class StudyStats(Study):
@@ -157,6 +531,63 @@ class StudyStats(Study):
     def __init__(self, Study):
         self.study = Study
 
+    @classmethod
+    def summarize(cls, tuples, low=2.5, high=97.5):
+        # every statistic below from one NaN-stripped array and a single partition
+        return summarize(tuples, low=low, high=high)
+
+    @classmethod
+    def stream(cls, chunks, low=2.5, high=97.5, **kwargs):
+        # same statistics from an iterator of value chunks that need not fit in memory;
+        # percentiles and the mode are sketched, so their rank error, value bounds and
+        # count error are reported (count_values=True counts values exactly)
+        return OnlineStats.from_chunks(chunks, **kwargs).result(low=low, high=high)
+
+    def bootstrap(self, stats=('mean', 'median'), by=('name', 'arm'), diff=None, field='value',
+                  n_boot=10_000, alpha=0.05, seed=0, workers=None):
+        # percentile bootstrap CIs per group, and for diff=(arm_a, arm_b) the per-biomarker
+        # arm difference; groups are spread over a process pool with per-task seeds
+        frame = self.study.as_dataframe()
+        values = frame[field].to_numpy(dtype=np.float64)
+        groups = frame.groupby(list(by), sort=True).indices
+
+        keys, tasks = [], []
+        for stat in stats:
+            for group, rows in groups.items():
+                keys.append((stat,) + (group if isinstance(group, tuple) else (group,)))
+                tasks.append((values[rows], None, stat))
+
+        if diff is not None:
+            assert (tuple(by) == ('name', 'arm')), 'arm differences need by=(name, arm)'
+            arm_a, arm_b = diff
+            names = frame.groupby(['name', 'arm'], sort=True).indices
+            for stat in stats:
+                for name in sorted(frame['name'].unique()):
+                    if (name, arm_a) in names and (name, arm_b) in names:
+                        keys.append((stat, name, f'{arm_a}-{arm_b}'))
+                        tasks.append((values[names[(name, arm_a)]], values[names[(name, arm_b)]], stat))
+
+        result = bootstrap_many(tasks, n_boot=n_boot, alpha=alpha, seed=seed, workers=workers)
+        index = pd.MultiIndex.from_tuples(keys, names=['stat'] + list(by))
+        return pd.DataFrame(result, index=index, columns=['estimate', 'low', 'high'])
+
+    def summarize_by(self, by=('name', 'arm'), field='value', low=2.5, high=97.5):
+        # per-group summaries as a frame indexed by the `by` columns, computed with
+        # segmented reductions rather than a loop over groups
+        frame = self.study.as_dataframe()
+        factors = [pd.factorize(frame[column]) for column in by]
+        key = np.zeros(len(frame), dtype=np.int64)
+        for codes, uniques in factors:
+            key = key * len(uniques) + codes
+        groups, result = summarize_groups(frame[field].to_numpy(dtype=np.float64), key, low=low, high=high)
+
+        # unpack the combined key back into one label array per `by` column
+        labels = []
+        for codes, uniques in reversed(factors):
+            labels.insert(0, np.asarray(uniques)[groups % len(uniques)])
+            groups = groups // len(uniques)
+        return pd.DataFrame(result, index=pd.MultiIndex.from_arrays(labels, names=list(by)))
+
     @classmethod
     def _ci(cls, tuples, low=2.5, high=97.5):
         _values = np.array(tuples)[~np.isnan(tuples)]
@@ -0,0 +1,64 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+STATS = {'mean': np.mean, 'median': np.median}
+
+# cap on resampled values held at once (batch * n)
+BATCH_VALUES = 2 ** 22
+
+
+def _strip(values):
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    return values[~np.isnan(values)]
+
+
+def _replicates(values, stat, n_boot, rng):
+    # bootstrap replicates of stat, resample indices drawn one (batch, n) block at a time
+    n = values.size
+    batch = max(1, min(n_boot, BATCH_VALUES // max(n, 1)))
+    out = np.empty(n_boot)
+    for start in range(0, n_boot, batch):
+        stop = min(start + batch, n_boot)
+        out[start:stop] = STATS[stat](values[rng.integers(0, n, size=(stop - start, n))], axis=1)
+    return out
+
+
+def bootstrap(values, stat='mean', n_boot=10_000, alpha=0.05, seed=0, other=None):
+    # percentile bootstrap CI of stat(values), or of stat(values) - stat(other) when other is given
+    rng = np.random.default_rng(seed)
+    values = _strip(values)
+    if values.size == 0:
+        return np.nan, np.nan, np.nan
+
+    estimate = STATS[stat](values)
+    replicates = _replicates(values, stat, n_boot, rng)
+    if other is not None:
+        other = _strip(other)
+        if other.size == 0:
+            return np.nan, np.nan, np.nan
+        estimate = estimate - STATS[stat](other)
+        replicates = replicates - _replicates(other, stat, n_boot, rng)
+
+    low, high = np.percentile(replicates, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return estimate, low, high
+
+
+def _task(args):
+    values, other, stat, n_boot, alpha, seed = args
+    return bootstrap(values, stat=stat, n_boot=n_boot, alpha=alpha, seed=seed, other=other)
+
+
+def bootstrap_many(tasks, n_boot=10_000, alpha=0.05, seed=0, workers=None):
+    # tasks: (values, other or None, stat) triples. each task gets its own child of one
+    # SeedSequence, so results do not depend on the worker count or scheduling
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    args = [(values, other, stat, n_boot, alpha, child) for (values, other, stat), child in zip(tasks, seeds)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(args) <= 1:
+        return [_task(a) for a in args]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_task, args, chunksize=max(1, len(args) // (4 * workers))))
@@ -0,0 +1,230 @@
+import numpy as np
+
+from .store import Categories, CODE_FIELDS, DTYPES, FIELDS, TIME_DTYPE, TIME_FIELDS, group_rows
+
+
+# fields a sorted range index can be kept on
+RANGE_FIELDS = ('time', 'baseline_enrolled_days', 'baseline_targeted_days')
+
+
+def _keys(column):
+    # datetimes sort as int64 (NaT first), floats as is (NaN last)
+    if column.dtype.kind == 'M':
+        return column.view(np.int64)
+    return column
+
+
+def _bounds(on, time_range):
+    low, high = (None, None) if time_range is None else time_range
+    if on in TIME_FIELDS:
+        nat = np.iinfo(np.int64).min
+        low = nat + 1 if low is None else np.datetime64(low).astype(TIME_DTYPE).astype(np.int64)
+        high = np.iinfo(np.int64).max if high is None else np.datetime64(high).astype(TIME_DTYPE).astype(np.int64)
+    else:
+        low = -np.inf if low is None else float(low)
+        high = np.inf if high is None else float(high)
+    return low, high
+
+
+class SortedIndex:
+    # sorted keys with (participant slot, row) payloads; inserts are buffered
+    # and merged in one pass on the next lookup
+
+    def __init__(self, dtype):
+        self.keys = np.empty(0, dtype=dtype)
+        self.slots = np.empty(0, dtype=np.int32)
+        self.rows = np.empty(0, dtype=np.int64)
+        self.pending = []
+
+    def __len__(self):
+        return len(self.keys) + sum(len(keys) for keys, _, _ in self.pending)
+
+    def add(self, keys, slots, rows):
+        self.pending.append((keys, slots, rows))
+        return self
+
+    def _merge(self):
+        if not self.pending:
+            return self
+        keys, slots, rows = [np.concatenate(x) for x in zip(*self.pending)]
+        self.pending = []
+
+        order = np.argsort(keys, kind='stable')
+        keys, slots, rows = keys[order], slots[order], rows[order]
+        at = np.searchsorted(self.keys, keys, side='right')
+        self.keys = np.insert(self.keys, at, keys)
+        self.slots = np.insert(self.slots, at, slots)
+        self.rows = np.insert(self.rows, at, rows)
+        return self
+
+    def remove(self, slots):
+        # drop every entry of the given participant slots
+        self._merge()
+        keep = ~np.isin(self.slots, slots)
+        self.keys, self.slots, self.rows = self.keys[keep], self.slots[keep], self.rows[keep]
+        return self
+
+    def range(self, low, high):
+        # payloads of keys in [low, high]
+        self._merge()
+        start = np.searchsorted(self.keys, low, side='left')
+        stop = np.searchsorted(self.keys, high, side='right')
+        return self.slots[start:stop], self.rows[start:stop]
+
+
+class StudyIndex:
+    # participant slots plus name -> arms, arm -> names and a sorted range
+    # index per (name, arm) for every indexed field
+
+    def __init__(self, fields=('time',)):
+        self.participants = []
+        self.slot_of = dict()
+        self.arms = Categories()
+        self.by_name = dict()
+        self.by_arm = dict()
+        self.ranges = {on: dict() for on in fields}
+        self._arm_lookup = dict()
+
+    @classmethod
+    def build(cls, participants, fields=('time',)):
+        # bulk build: one concatenation and sort per biomarker name instead of per block
+        index = cls(fields=())
+        for part in participants:
+            index._slot(part)
+        for on in fields:
+            index.ensure(on)
+        return index
+
+    def _slot(self, part):
+        self.slot_of.update({part.name: len(self.participants)})
+        self.participants.append(part)
+        return len(self.participants) - 1
+
+    def _arm_codes(self, block, rows):
+        # block arm codes are local to the participant's categories, re-encode them study wide
+        categories = block.categories['arm']
+        lookup = self._arm_lookup.get(id(categories))
+        if lookup is None or len(lookup) != len(categories):
+            lookup = np.array([self.arms.encode(label) for label in categories.labels], dtype=np.int32)
+            self._arm_lookup.update({id(categories): lookup})
+        return lookup[block.column('arm')[rows]]
+
+    def _add(self, name, blocks, fields):
+        # blocks: (slot, block, rows) triples that all hold readings of name
+        slots = np.concatenate([np.full(len(rows), slot, dtype=np.int32) for slot, _, rows in blocks])
+        rows = np.concatenate([rows for _, _, rows in blocks])
+        arm_codes = np.concatenate([self._arm_codes(block, rows) for _, block, rows in blocks])
+        keys = {on: np.concatenate([_keys(block.column(on))[rows] for _, block, rows in blocks]) for on in fields}
+
+        order, starts, stops = group_rows(arm_codes)
+        for lo, hi in zip(starts, stops):
+            chunk = order[lo:hi]
+            arm = self.arms.labels[arm_codes[chunk[0]]]
+            self.by_name.setdefault(name, dict()).update({arm: None})
+            self.by_arm.setdefault(arm, dict()).update({name: None})
+            for on in fields:
+                self._range(on, name, arm).add(keys[on][chunk], slots[chunk], rows[chunk])
+        return self
+
+    def add_participant(self, part):
+        if part.name in self.slot_of.keys():
+            return self
+        slot = self._slot(part)
+        for name, block in part.store.items():
+            self._add(name, [(slot, block, np.arange(block.size, dtype=np.int64))], self.ranges.keys())
+        return self
+
+    def add_rows(self, changes):
+        # index rows [start, stop) of the participant's block for name, for every
+        # (participant, name, start, stop) change, with one _add per name
+        chunks = dict()
+        for part, name, start, stop in changes:
+            slot = self.slot_of.get(part.name)
+            if slot is not None and stop > start:
+                rows = np.arange(start, stop, dtype=np.int64)
+                chunks.setdefault(name, []).append((slot, part.store.get(name), rows))
+        for name, blocks in chunks.items():
+            self._add(name, blocks, self.ranges.keys())
+        return self
+
+    def refresh(self, parts, fields=RANGE_FIELDS):
+        # re-key the rows of participants whose columns were rewritten in place
+        slots = np.array([self.slot_of[part.name] for part in parts if part.name in self.slot_of], dtype=np.int32)
+        for on in fields:
+            if on not in self.ranges.keys():
+                continue
+            for index in self.ranges[on].values():
+                index.remove(slots)
+            chunks = dict()
+            for slot in slots:
+                for name, block in self.participants[slot].store.items():
+                    if block.size:
+                        chunks.setdefault(name, []).append((slot, block, np.arange(block.size, dtype=np.int64)))
+            for name, blocks in chunks.items():
+                self._add(name, blocks, [on])
+        return self
+
+    def _range(self, on, name, arm):
+        indexes = self.ranges[on]
+        if (name, arm) not in indexes.keys():
+            dtype = np.int64 if on in TIME_FIELDS else np.float64
+            indexes.update({(name, arm): SortedIndex(dtype)})
+        return indexes.get((name, arm))
+
+    def ensure(self, on):
+        # build a range index for a new field from the current blocks, then keep it maintained
+        assert (on in RANGE_FIELDS), f'no range index on {on}'
+        if on in self.ranges.keys():
+            return self
+        self.ranges.update({on: dict()})
+        chunks = dict()
+        for slot, part in enumerate(self.participants):
+            for name, block in part.store.items():
+                if block.size:
+                    chunks.setdefault(name, []).append((slot, block, np.arange(block.size, dtype=np.int64)))
+        for name, blocks in chunks.items():
+            self._add(name, blocks, [on])
+        return self
+
+    def lookup(self, name=None, arm=None, time_range=None, on='time'):
+        # (slots, rows) of matching readings, grouped by name and arm and sorted on `on` within each
+        self.ensure(on)
+        low, high = _bounds(on, time_range)
+
+        if name is not None:
+            names = [name]
+        elif arm is not None:
+            # arm-only lookups visit just the names recorded in that arm
+            names = list(self.by_arm.get(arm, dict()).keys())
+        else:
+            names = list(self.by_name.keys())
+        matches = []
+        for name in names:
+            arms = self.by_name.get(name, dict()).keys() if arm is None else [arm]
+            for arm_label in arms:
+                index = self.ranges[on].get((name, arm_label))
+                if index is not None:
+                    slots, rows = index.range(low, high)
+                    matches.append((name, slots, rows))
+        return matches
+
+    def gather(self, matches):
+        # materialize the matched rows as columns, in match order
+        total = sum(len(rows) for _, _, rows in matches)
+        columns = {field: np.empty(total, dtype=DTYPES[field] if field in DTYPES and field not in CODE_FIELDS else object)
+                   for field in FIELDS}
+
+        offset = 0
+        for name, slots, rows in matches:
+            n = len(rows)
+            columns['name'][offset:offset + n] = name
+            order, starts, stops = group_rows(slots)
+            for lo, hi in zip(starts, stops):
+                at = offset + order[lo:hi]
+                block = self.participants[slots[order[lo]]].store.get(name)
+                for field in FIELDS:
+                    if field != 'name':
+                        columns[field][at] = block.labels(field, rows[order[lo:hi]])
+            offset += n
+
+        return columns
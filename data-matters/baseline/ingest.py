@@ -0,0 +1,167 @@
+import io
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+from .store import CODE_FIELDS, TIME_FIELDS, Categories, as_columns, group_rows
+
+
+# bytes of CSV (or parquet row groups of about this size) parsed per task; bounds the
+# memory of every worker and of the results in flight
+CHUNK_BYTES = 64 * 2 ** 20
+
+LABEL_FIELDS = CODE_FIELDS + ('name',)
+
+# pandas' default missing value markers, kept for every field but the labels, which are
+# read as strings ('007' stays '007') with empty cells as ''
+NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+             '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+
+def _csv_pieces(path, chunk_bytes):
+    # byte ranges that start and end on line boundaries; assumes no quoted newlines
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        bounds = [f.tell()]
+        while bounds[-1] < size:
+            f.seek(min(bounds[-1] + chunk_bytes, size))
+            if f.tell() < size:
+                f.readline()
+            bounds.append(f.tell())
+    return [('csv', str(path), header, start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def _parquet_pieces(path, chunk_bytes):
+    assert (pq is not None), 'reading parquet needs pyarrow'
+    meta = pq.ParquetFile(path).metadata
+    pieces, groups, size = [], [], 0
+    for i in range(meta.num_row_groups):
+        groups.append(i)
+        size += meta.row_group(i).total_byte_size
+        if size >= chunk_bytes:
+            pieces.append(('parquet', str(path), groups))
+            groups, size = [], 0
+    if groups:
+        pieces.append(('parquet', str(path), groups))
+    return pieces
+
+
+def pieces(paths, chunk_bytes=CHUNK_BYTES):
+    out = []
+    for path in [paths] if isinstance(paths, (str, Path)) else paths:
+        parquet = Path(path).suffix.lower() in ('.parquet', '.pq')
+        out.extend(_parquet_pieces(path, chunk_bytes) if parquet else _csv_pieces(path, chunk_bytes))
+    return out
+
+
+def _read(piece, rename=None):
+    if piece[0] == 'parquet':
+        _, path, groups = piece
+        return pq.ParquetFile(path).read_row_groups(groups).to_pandas()
+
+    _, path, header, start, stop = piece
+    with open(path, 'rb') as f:
+        f.seek(start)
+        body = f.read(stop - start)
+    fields = pd.read_csv(io.BytesIO(header), nrows=0).columns
+    target = {field: (rename or dict()).get(field, field) for field in fields}
+    labels = [field for field in fields if target[field] in LABEL_FIELDS]
+    return pd.read_csv(io.BytesIO(header + body), dtype=dict.fromkeys(labels, str), keep_default_na=False,
+                       na_values={field: NA_VALUES for field in fields if field not in labels},
+                       parse_dates=[field for field in fields if target[field] in TIME_FIELDS])
+
+
+def _task(args):
+    # one piece to typed columns with labels encoded against piece local categories, split
+    # by participant into one spill file per partition it has rows for
+    i, piece, rename, partitions, folder = args
+    data = _read(piece, rename)
+    if rename:
+        data = data.rename(columns=rename)
+    columns = as_columns(data)
+    labels = dict()
+    for field in LABEL_FIELDS:
+        local = Categories()
+        columns[field] = local.encode_many(columns[field])
+        labels[field] = local.labels
+
+    # a participant's partition follows from its label alone, so it is the same in every piece
+    slot = pd.util.hash_array(np.asarray(labels['participant'], dtype=object)) % np.uint64(partitions)
+    order, starts, stops = group_rows(slot.astype(np.int64)[columns['participant']])
+    spilled = []
+    for start, stop in zip(starts, stops):
+        rows = np.sort(order[start:stop])
+        p = int(slot[columns['participant'][rows[0]]])
+        np.savez(os.path.join(folder, f'{p}-{i}.npz'), **{field: column[rows] for field, column in columns.items()})
+        spilled.append(p)
+    return labels, spilled
+
+
+def _results(tasks, workers):
+    # results in piece order, with at most 2 * workers pieces parsed ahead of the merge
+    if workers <= 1:
+        for task in tasks:
+            yield _task(task)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+            pending.append(pool.submit(_task, task))
+        while pending:
+            yield pending.popleft().result()
+
+
+def load(cls, name, paths, workers=None, chunk_bytes=CHUNK_BYTES, rename=None):
+    # workers parse pieces and partition their rows by participant into spill files; the
+    # parent maps every piece's labels onto the study categories in piece order, then
+    # merges one partition (about one piece of rows) at a time with a grouped extend, so
+    # peak memory is the study plus one partition rather than all parsed pieces
+    listed = pieces(paths, chunk_bytes)
+    partitions = max(len(listed), 1)
+    workers = min(workers or os.cpu_count() or 1, partitions)
+
+    study = cls(name)
+    names = Categories()
+    targets = dict(study.categories, name=names)
+    with tempfile.TemporaryDirectory() as folder:
+        lookups, spilled = [], []
+        for labels, present in _results([(i, piece, rename, partitions, folder) for i, piece in enumerate(listed)], workers):
+            lookups.append({field: targets[field].encode_many(labels[field]) for field in LABEL_FIELDS})
+            spilled.append(set(present))
+
+        for p in range(partitions):
+            parts = []
+            for i, lookup in enumerate(lookups):
+                if p not in spilled[i]:
+                    continue
+                path = os.path.join(folder, f'{p}-{i}.npz')
+                with np.load(path) as spill:
+                    columns = {field: spill[field] for field in spill.files}
+                os.remove(path)
+                for field in LABEL_FIELDS:
+                    columns[field] = lookup[field][columns[field]]
+                parts.append(columns)
+            if parts:
+                columns = {field: np.concatenate([part[field] for part in parts]) for field in parts[0]}
+                name_codes = columns.pop('name')
+                study._extend_columns(columns, names, name_codes)
+
+    # participants in order of first appearance, as from_dataframe leaves them
+    codes = study.categories['participant'].codes
+    for participants in (study.participants, study.participants_class):
+        for key in sorted(participants, key=codes.get):
+            participants[key] = participants.pop(key)
+    return study
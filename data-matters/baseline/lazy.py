@@ -0,0 +1,340 @@
+import numpy as np
+import pandas as pd
+
+from .index import RANGE_FIELDS
+from .query import _predicate
+from .store import CODE_FIELDS, DTYPES, FIELDS, TIME_DTYPE, TIME_FIELDS, Categories, group_rows
+from .summary import summarize_groups
+
+
+_LABEL_FIELDS = CODE_FIELDS + ('name',)
+_OPS = {'==': np.equal, '!=': np.not_equal, '>': np.greater, '>=': np.greater_equal,
+        '<': np.less, '<=': np.less_equal}
+_OBJECTPATH_OPS = {'is': '==', 'is not': '!='}
+# operators a sorted index range answers
+_BOUNDS = ('>', '>=', '<', '<=', '==')
+
+
+def _literal(field, value):
+    if field in TIME_FIELDS:
+        return np.datetime64(value).astype(TIME_DTYPE)
+    if field in _LABEL_FIELDS:
+        return value
+    return float(value)
+
+
+class Term:
+    # one comparison of a field with a literal; a query's predicate is the conjunction of its terms
+
+    def __init__(self, field, op, literal):
+        assert (field in FIELDS), f'no field {field}'
+        assert (op in _OPS or op == 'in'), f'no operator {op}'
+        assert (field not in _LABEL_FIELDS or op in ('==', '!=', 'in')), f'{field} only compares for equality'
+        self.field = field
+        self.op = op
+        self.literal = tuple(_literal(field, x) for x in literal) if op == 'in' else _literal(field, literal)
+
+    def __repr__(self):
+        literal = self.literal
+        if self.field in TIME_FIELDS:
+            literal = tuple(str(x) for x in literal) if self.op == 'in' else str(literal)
+        return f'{self.field} {self.op} {literal!r}'
+
+    def mask(self, column, categories=None):
+        # column holds raw values, or study wide codes for label fields
+        literal = self.literal
+        if categories is not None:
+            literal = tuple(categories.codes.get(x, -1) for x in literal) if self.op == 'in' \
+                else categories.codes.get(literal, -1)
+        if self.op == 'in':
+            return np.isin(column, np.asarray(literal, dtype=column.dtype))
+        return _OPS[self.op](column, literal)
+
+
+class Col:
+    # col('value') > 100 and friends build Terms for LazyQuery.where
+
+    def __init__(self, field):
+        assert (field in FIELDS), f'no field {field}'
+        self.field = field
+
+    def __eq__(self, other):
+        return Term(self.field, '==', other)
+
+    def __ne__(self, other):
+        return Term(self.field, '!=', other)
+
+    def __gt__(self, other):
+        return Term(self.field, '>', other)
+
+    def __ge__(self, other):
+        return Term(self.field, '>=', other)
+
+    def __lt__(self, other):
+        return Term(self.field, '<', other)
+
+    def __le__(self, other):
+        return Term(self.field, '<=', other)
+
+    def isin(self, values):
+        return Term(self.field, 'in', tuple(values))
+
+    def between(self, low, high):
+        return (Term(self.field, '>=', low), Term(self.field, '<=', high))
+
+
+def col(field):
+    return Col(field)
+
+
+def _terms(args, kwargs):
+    # Terms, tuples of Terms, objectpath style conjunctions ('@.value > 5 and @.arm is "a"')
+    # and field=value (or field=[values]) keywords
+    terms = []
+    for arg in args:
+        if isinstance(arg, str):
+            clauses = _predicate(arg)
+            assert (clauses is not None and len(clauses) == 1), f'cannot run {arg!r} lazily'
+            terms.extend(Term(field, _OBJECTPATH_OPS.get(op, op), literal) for field, op, literal in clauses[0])
+        elif isinstance(arg, Term):
+            terms.append(arg)
+        else:
+            terms.extend(arg)
+    for field, value in kwargs.items():
+        many = isinstance(value, (list, tuple, set, np.ndarray, pd.Index))
+        terms.append(Term(field, 'in', tuple(value)) if many else Term(field, '==', value))
+    return terms
+
+
+def _allowed(terms, field):
+    # labels a conjunction of ==/in terms allows for field, None when unconstrained
+    allowed = None
+    for term in terms:
+        if term.field == field and term.op in ('==', 'in'):
+            labels = set(term.literal) if term.op == 'in' else {term.literal}
+            allowed = labels if allowed is None else allowed & labels
+    return allowed
+
+
+def _range(terms, on):
+    # inclusive [low, high] on the index key implied by the bound terms on `on`
+    time = on in TIME_FIELDS
+    low, high = (np.iinfo(np.int64).min + 1, np.iinfo(np.int64).max) if time else (-np.inf, np.inf)
+    for term in terms:
+        if term.field != on or term.op not in _BOUNDS:
+            continue
+        key = term.literal.astype(np.int64) if time else term.literal
+        if term.op in ('>', '>=', '=='):
+            start = key + 1 if time and term.op == '>' else np.nextafter(key, np.inf) if term.op == '>' else key
+            low = max(low, start)
+        if term.op in ('<', '<=', '=='):
+            stop = key - 1 if time and term.op == '<' else np.nextafter(key, -np.inf) if term.op == '<' else key
+            high = min(high, stop)
+    return low, high
+
+
+class Plan:
+    # physical plan: how rows are found (index range or block scan), the terms left to
+    # evaluate per block, and the only fields read from the blocks
+
+    def __init__(self, access, names, arms, on, bounds, residual, output, agg):
+        self.access = access
+        self.names = names
+        self.arms = arms
+        self.on = on
+        self.bounds = bounds
+        self.residual = residual
+        self.output = output
+        self.agg = agg
+        self.read = tuple(dict.fromkeys(list(output) + [term.field for term in residual if term.field != 'name']))
+
+    def __repr__(self):
+        names = '*' if self.names is None else sorted(self.names)
+        arms = '*' if self.arms is None else sorted(self.arms)
+        if self.access == 'index':
+            low, high = self.bounds
+            if self.on in TIME_FIELDS:
+                low, high = [str(np.int64(x).astype(TIME_DTYPE)) for x in (low, high)]
+            lines = [f'index range {self.on} in [{low}, {high}] name in {names} arm in {arms}']
+        elif self.access == 'empty':
+            lines = ['empty (contradictory name or arm terms)']
+        else:
+            lines = [f'scan blocks name in {names}']
+        if self.residual:
+            lines.append('filter ' + ' and '.join(repr(term) for term in self.residual))
+        lines.append('read ' + ', '.join(self.read))
+        if self.agg is not None:
+            lines.append('agg {} of {} by {}'.format(', '.join(self.agg['stats']), self.agg['field'],
+                                                     ', '.join(self.agg['by']) or '()'))
+        return '\n'.join(lines)
+
+
+class LazyQuery:
+    # deferred query over a Study: where/select/agg only record steps, collect() optimizes
+    # the plan against the study as it is then and runs it in one pass over the blocks.
+    # every step returns a new query, so partial queries can be shared and extended
+
+    def __init__(self, study, steps=()):
+        self.study = study
+        self.steps = tuple(steps)
+
+    def _then(self, step):
+        assert (not any(kind == 'agg' for kind, _ in self.steps)), 'agg is the last step'
+        return LazyQuery(self.study, self.steps + (step,))
+
+    def _fields(self):
+        fields = FIELDS
+        for kind, arg in self.steps:
+            if kind == 'select':
+                fields = arg
+        return fields
+
+    def where(self, *terms, **equals):
+        terms = tuple(_terms(terms, equals))
+        fields = self._fields()
+        for term in terms:
+            assert (term.field in fields), f'{term.field} is not selected'
+        return self._then(('where', terms))
+
+    def select(self, *fields):
+        current = self._fields()
+        for field in fields:
+            assert (field in current), f'{field} is not selected'
+        return self._then(('select', tuple(fields)))
+
+    def agg(self, stats=('n', 'mean', 'median'), by=('name', 'arm'), field='value', low=2.5, high=97.5):
+        current = self._fields()
+        for name in tuple(by) + (field,):
+            assert (name in current), f'{name} is not selected'
+        for name in by:
+            assert (name in _LABEL_FIELDS), f'cannot group by {name}'
+        return self._then(('agg', dict(stats=tuple(stats), by=tuple(by), field=field, low=low, high=high)))
+
+    def optimize(self):
+        # predicate pushdown: name and arm equalities pick the (name, arm) range indexes or
+        # the blocks to scan, bounds on one range field become an index range; projection
+        # pruning: only the fields of the output and of the remaining terms are read
+        terms = [term for kind, arg in self.steps if kind == 'where' for term in arg]
+        agg = next((arg for kind, arg in self.steps if kind == 'agg'), None)
+        output = self._fields() if agg is None else tuple(dict.fromkeys(agg['by'] + (agg['field'],)))
+
+        names, arms = _allowed(terms, 'name'), _allowed(terms, 'arm')
+        if names == set() or arms == set():
+            return Plan('empty', names, arms, None, None, [], output, agg)
+        # names prune whole blocks either way
+        residual = [term for term in terms if not (term.field == 'name' and term.op in ('==', 'in'))]
+
+        # an index range only pays (and only keeps NaT / NaN rows out correctly) when a range
+        # field is bounded; prefer a field whose index already exists
+        bounded = [on for on in RANGE_FIELDS if any(term.field == on and term.op in _BOUNDS for term in terms)]
+        if not bounded:
+            return Plan('scan', names, arms, None, None, residual, output, agg)
+        built = self.study.index.ranges.keys() if self.study.index is not None else ()
+        on = sorted(bounded, key=lambda field: field not in built)[0]
+
+        # the (name, arm) indexes and the key range cover arm equalities and the bounds on `on`
+        residual = [term for term in residual if not (term.field == 'arm' and term.op in ('==', 'in'))
+                    and not (term.field == on and term.op in _BOUNDS)]
+        return Plan('index', names, arms, on, _range(terms, on), residual, output, agg)
+
+    def explain(self):
+        logical = []
+        for kind, arg in self.steps:
+            if kind == 'where':
+                logical.append('where ' + ' and '.join(repr(term) for term in arg))
+            elif kind == 'select':
+                logical.append('select ' + ', '.join(arg))
+            else:
+                logical.append('agg {} of {} by {}'.format(', '.join(arg['stats']), arg['field'], ', '.join(arg['by']) or '()'))
+        optimized = repr(self.optimize())
+        return 'logical:\n  {}\noptimized:\n  {}'.format('\n  '.join(logical or ['scan']), optimized.replace('\n', '\n  '))
+
+    def _chunks(self, plan):
+        # (block, rows) pairs to read; rows None for a whole block
+        study = self.study
+        if plan.access == 'empty':
+            return []
+        if plan.access == 'scan':
+            return [(block, None) for part in study.participants.values() for name, block in part[0].store.items()
+                    if block.size and (plan.names is None or name in plan.names)]
+
+        index = study._indexed()
+        index.ensure(plan.on)
+        chunks = []
+        for (name, arm), sorted_index in index.ranges[plan.on].items():
+            if (plan.names is None or name in plan.names) and (plan.arms is None or arm in plan.arms):
+                slots, rows = sorted_index.range(*plan.bounds)
+                order, starts, stops = group_rows(slots)
+                for lo, hi in zip(starts, stops):
+                    part = index.participants[slots[order[lo]]]
+                    chunks.append((part.store.get(name), np.sort(rows[order[lo:hi]])))
+        return chunks
+
+    def _column(self, chunks, field, names):
+        # one field of every chunk, concatenated; labels as study wide codes (names as codes of `names`)
+        if field == 'name':
+            codes = np.array([names.encode(block.name) for block, _ in chunks], dtype=np.int64)
+            return np.repeat(codes, np.array([block.size if rows is None else len(rows) for block, rows in chunks], dtype=np.int64))
+        parts = []
+        for block, rows in chunks:
+            column = block.column(field) if rows is None else block.arrays[field][rows]
+            if field in CODE_FIELDS and block.categories is not self.study.categories:
+                column = self.study.categories[field].encode_many(block.categories[field].decode(column))
+            parts.append(column)
+        return np.concatenate(parts or [np.empty(0, dtype=DTYPES[field])])
+
+    def collect(self):
+        # column at a time: the fields of the remaining terms are read for every chunk and
+        # filtered with whole-column masks, the other output fields only at surviving rows
+        plan = self.optimize()
+        categories = dict(self.study.categories, name=Categories())
+        chunks = self._chunks(plan)
+        columns = dict()
+        if plan.residual:
+            sizes = np.array([block.size if rows is None else len(rows) for block, rows in chunks], dtype=np.int64)
+            mask = np.ones(sizes.sum(), dtype=bool)
+            for term in plan.residual:
+                if term.field == 'name':
+                    keep = term.mask(np.array([block.name for block, _ in chunks], dtype=object))
+                    mask &= np.repeat(keep, sizes)
+                else:
+                    if term.field not in columns:
+                        columns[term.field] = self._column(chunks, term.field, categories['name'])
+                    mask &= term.mask(columns[term.field], self.study.categories.get(term.field))
+
+            columns = {field: column[mask] for field, column in columns.items() if field in plan.output}
+            starts = np.cumsum(sizes) - sizes
+            kept = np.add.reduceat(mask, starts) if len(chunks) else sizes
+            survivors = []
+            for i in np.flatnonzero(kept):
+                block, rows = chunks[i]
+                at = mask[starts[i]:starts[i] + sizes[i]].nonzero()[0]
+                survivors.append((block, at if rows is None else rows[at]))
+            chunks = survivors
+        for field in plan.output:
+            if field not in columns:
+                columns[field] = self._column(chunks, field, categories['name'])
+
+        if plan.agg is None:
+            return pd.DataFrame({field: np.asarray(categories[field].labels, dtype=object)[columns[field]]
+                                 if field in _LABEL_FIELDS else columns[field] for field in plan.output})
+        return self._aggregate(plan.agg, columns, categories)
+
+    @classmethod
+    def _aggregate(cls, agg, columns, categories):
+        # one segmented reduction over the combined (by...) key, as in StudyStats.summarize_by
+        by = agg['by']
+        key = np.zeros(len(columns[agg['field']]), dtype=np.int64)
+        for field in by:
+            key = key * max(len(categories[field]), 1) + columns[field]
+        groups, result = summarize_groups(columns[agg['field']], key, low=agg['low'], high=agg['high'])
+        result = {stat: result[stat] for stat in agg['stats']}
+        if not by:
+            return pd.DataFrame(result)
+
+        labels = []
+        for field in reversed(by):
+            size = max(len(categories[field]), 1)
+            labels.insert(0, np.asarray(categories[field].labels, dtype=object)[groups % size])
+            groups = groups // size
+        return pd.DataFrame(result, index=pd.MultiIndex.from_arrays(labels, names=list(by))).sort_index()
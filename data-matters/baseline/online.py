@@ -0,0 +1,235 @@
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+
+
+class Moments:
+    # mergeable running count / mean / sum of squared deviations (Welford, Chan et al. for chunks)
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        if values.size:
+            other = Moments()
+            other.n = values.size
+            other.mean = values.mean()
+            other.m2 = np.sum((values - other.mean) ** 2)
+            self.merge(other)
+        return self
+
+    def merge(self, other):
+        n = self.n + other.n
+        if other.n:
+            delta = other.mean - self.mean
+            self.mean = self.mean + delta * other.n / n
+            self.m2 = self.m2 + other.m2 + delta ** 2 * self.n * other.n / n
+            self.n = n
+        return self
+
+    @property
+    def std(self):
+        # population std, as StudyStats._std
+        return np.sqrt(self.m2 / self.n) if self.n else np.nan
+
+
+class QuantileSketch:
+    # KLL-style compactor hierarchy: an item at level h stands for 2**h inputs.
+    # compacting a sorted level keeps every other item (random offset), which
+    # moves any rank by at most 2**h, so the total rank error is tracked exactly
+
+    def __init__(self, k=1024, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self.error = 0.0
+        self.error_sq = 0.0
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += values.size
+        return self._compress()
+
+    def merge(self, other):
+        for h, level in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self.error += other.error
+        self.error_sq += other.error_sq
+        return self._compress()
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if level.size > self.k:
+                level = np.sort(level)
+                keep, level = level[level.size - level.size % 2:], level[:level.size - level.size % 2]
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], level[self.rng.integers(2)::2]])
+                self.error += 2.0 ** h
+                self.error_sq += 4.0 ** h
+            h += 1
+        return self
+
+    def rank_error(self, delta=0.01):
+        # fractional rank error: the worst case, or the Hoeffding bound holding with probability 1 - delta
+        if self.n == 0:
+            return 0.0
+        return min(self.error, np.sqrt(2 * self.error_sq * np.log(2 / delta))) / self.n
+
+    def quantile(self, q):
+        # q in [0, 1]; exact (numpy 'linear') until the first compaction
+        if self.n == 0:
+            return np.nan
+        if self.error == 0:
+            return np.percentile(self.levels[0], 100 * q)
+
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.size, 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        ranks = np.cumsum(weights[order])
+        at = np.searchsorted(ranks, q * ranks[-1], side='left')
+        return values[order][min(at, values.size - 1)]
+
+    def interval(self, q, delta=0.01):
+        # values bracketing the true q-quantile given the rank error
+        eps = self.rank_error(delta)
+        return self.quantile(max(q - eps, 0.0)), self.quantile(min(q + eps, 1.0))
+
+
+class HeavyHitters:
+    # mergeable Misra-Gries summary in at most m counters: when more values are tracked, the
+    # (m + 1)-th largest count is taken off every counter and the empty ones dropped, so a
+    # count undercounts its value by at most `error` <= n / (m + 1)
+
+    def __init__(self, m=1024):
+        self.m = m
+        self.values = np.empty(0)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.error = 0
+
+    def _add(self, values, counts):
+        values, inverse = np.unique(np.concatenate([self.values, values]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([self.counts, counts])).astype(np.int64)
+        if values.size > self.m:
+            cut = np.partition(counts, values.size - self.m - 1)[values.size - self.m - 1]
+            counts = counts - cut
+            self.error += int(cut)
+            values, counts = values[counts > 0], counts[counts > 0]
+        self.values, self.counts = values, counts
+        return self
+
+    def update(self, values):
+        unique, counts = np.unique(values, return_counts=True)
+        return self._add(unique, counts)
+
+    def merge(self, other):
+        self.error += other.error
+        return self._add(other.values, other.counts)
+
+    def mode(self):
+        # most counted value, ties to the smallest; exact while error is 0
+        if self.counts.size == 0:
+            return np.nan, 0
+        best = self.counts.argmax()
+        return self.values[best], int(self.counts[best])
+
+
+@dataclass
+class StreamSummary:
+    n: int
+    n_missing: int
+    mean: float
+    std: float
+    median: float
+    median_bounds: tuple
+    ci_low: float
+    ci_high: float
+    ci_bounds: tuple
+    rank_error: float
+    mode: float
+    mode_count: int
+    mode_error: int
+    counts: dict
+
+
+class OnlineStats:
+    # chunk-at-a-time accumulators for everything StudyStats computes from a full tuple;
+    # partial accumulators from different partitions combine with merge(). the mode comes
+    # from a bounded heavy hitter sketch; count_values=True keeps exact counts of every
+    # distinct value instead, for categorical data with few of them
+
+    def __init__(self, k=1024, seed=0, count_values=False, m=1024):
+        self.moments = Moments()
+        self.sketch = QuantileSketch(k=k, seed=seed)
+        self.counts = Counter() if count_values else None
+        self.heavy = None if count_values else HeavyHitters(m)
+        self.n_missing = 0
+
+    def update(self, chunk):
+        values = np.asarray(chunk, dtype=np.float64).ravel()
+        missing = np.isnan(values)
+        self.n_missing += int(missing.sum())
+        values = values[~missing]
+
+        self.moments.update(values)
+        self.sketch.update(values)
+        if self.counts is not None:
+            unique, counts = np.unique(values, return_counts=True)
+            self.counts.update(dict(zip(unique.tolist(), counts.tolist())))
+        else:
+            self.heavy.update(values)
+        return self
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        assert ((self.counts is None) == (other.counts is None)), 'both count values exactly or both sketch'
+        if self.counts is not None:
+            self.counts.update(other.counts)
+        else:
+            self.heavy.merge(other.heavy)
+        self.n_missing += other.n_missing
+        return self
+
+    @classmethod
+    def from_chunks(cls, chunks, **kwargs):
+        stats = cls(**kwargs)
+        for chunk in chunks:
+            stats.update(chunk)
+        return stats
+
+    def result(self, low=2.5, high=97.5, delta=0.01):
+        mode, mode_count = np.nan, 0
+        if self.counts:
+            # smallest of the most frequent values, as scipy.stats.mode
+            mode_count = max(self.counts.values())
+            mode = min(value for value, count in self.counts.items() if count == mode_count)
+        elif self.heavy is not None:
+            mode, mode_count = self.heavy.mode()
+
+        return StreamSummary(
+            n=self.moments.n,
+            n_missing=self.n_missing,
+            mean=self.moments.mean if self.moments.n else np.nan,
+            std=self.moments.std,
+            median=self.sketch.quantile(0.5),
+            median_bounds=self.sketch.interval(0.5, delta),
+            ci_low=self.sketch.quantile(low / 100),
+            ci_high=self.sketch.quantile(high / 100),
+            ci_bounds=(self.sketch.interval(low / 100, delta), self.sketch.interval(high / 100, delta)),
+            rank_error=self.sketch.rank_error(delta),
+            mode=mode,
+            mode_count=mode_count,
+            mode_error=0 if self.heavy is None else self.heavy.error,
+            counts=dict(self.counts) if self.counts is not None else None,
+        )
@@ -0,0 +1,92 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .store import Categories, CODE_FIELDS, DTYPES
+
+
+FORMAT = 1
+
+# layout:
+#   <path>/manifest.json               study name, participants, label categories, biomarker list
+#   <path>/biomarkers/<i>/<field>.npy  one column per field, all participants' rows for biomarker i
+#   <path>/biomarkers/<i>/offsets.npy  row offsets of each participant slot listed for biomarker i
+
+
+def save(study, path):
+    path = Path(path)
+    (path / 'biomarkers').mkdir(parents=True, exist_ok=True)
+
+    participants = list(study.participants.keys())
+    slot_of = {name: slot for slot, name in enumerate(participants)}
+    categories = {field: Categories(study.categories[field].labels) for field in CODE_FIELDS}
+
+    # gather blocks per biomarker name, keeping participant order
+    blocks = dict()
+    for part_name in participants:
+        for name, block in study.participants[part_name][0].store.items():
+            blocks.setdefault(name, []).append((slot_of[part_name], block))
+
+    manifest = {'format': FORMAT, 'name': study.name, 'participants': participants, 'biomarkers': []}
+    for i, (name, parts) in enumerate(blocks.items()):
+        folder = path / 'biomarkers' / str(i)
+        folder.mkdir(exist_ok=True)
+        for field in DTYPES:
+            if field in CODE_FIELDS:
+                # codes of blocks with their own categories are re-encoded study wide
+                column = np.concatenate([block.column(field) if block.categories is study.categories
+                                         else categories[field].encode_many(block.labels(field)) for _, block in parts])
+            else:
+                column = np.concatenate([block.column(field) for _, block in parts])
+            np.save(folder / f'{field}.npy', np.ascontiguousarray(column, dtype=DTYPES[field]))
+        np.save(folder / 'offsets.npy', np.cumsum([0] + [block.size for _, block in parts]).astype(np.int64))
+        manifest['biomarkers'].append({'name': name, 'dir': str(i), 'rows': int(sum(b.size for _, b in parts)),
+                                       'participants': [slot for slot, _ in parts]})
+
+    # each participant's own block order, as biomarker numbers
+    number = {name: i for i, name in enumerate(blocks)}
+    manifest['stores'] = [[number[name] for name in study.participants[part_name][0].store.keys()]
+                          for part_name in participants]
+    manifest['categories'] = {field: categories[field].labels for field in CODE_FIELDS}
+    with open(path / 'manifest.json', 'w') as f:
+        json.dump(manifest, f)
+    return path
+
+
+def load(cls, path, mmap=True):
+    # columns are memory mapped copy-on-write, so a biomarker's bytes are only read when touched
+    path = Path(path)
+    with open(path / 'manifest.json') as f:
+        manifest = json.load(f)
+    assert (manifest.get('format') == FORMAT), f'unknown study format {manifest.get("format")}'
+
+    study = cls(manifest['name'])
+    study.categories.update({field: Categories(manifest['categories'][field]) for field in CODE_FIELDS})
+
+    parts = []
+    for part_name in manifest['participants']:
+        part = study._new_participant(part_name)
+        parts.append(part)
+
+    pieces = dict()
+    for i, entry in enumerate(manifest['biomarkers']):
+        folder = path / 'biomarkers' / entry['dir']
+        columns = {field: np.load(folder / f'{field}.npy', mmap_mode='c' if mmap else None) for field in DTYPES}
+        offsets = np.load(folder / 'offsets.npy')
+        for slot, start, stop in zip(entry['participants'], offsets[:-1], offsets[1:]):
+            pieces.update({(slot, i): {field: column[start:stop] for field, column in columns.items()}})
+
+    # blocks are added in each participant's saved order (biomarker order for older files)
+    stores = manifest.get('stores')
+    if stores is None:
+        stores = [[] for _ in parts]
+        for slot, i in pieces:
+            stores[slot].append(i)
+    for slot, numbers in enumerate(stores):
+        for i in numbers:
+            parts[slot]._extend(manifest['biomarkers'][i]['name'], pieces[(slot, i)])
+
+    for part in parts:
+        study._add_participant(part)
+    return study
@@ -0,0 +1,118 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from .store import CODE_FIELDS, FIELDS, FLOAT_FIELDS
+
+
+# the objectpath shapes that run directly on the column blocks:
+#   $..<name>  |  $..<name>.<field>  |  $..<name>[<predicate>]  |  $..<name>[<predicate>].<field>
+# participants also accept a single dot, e.g. $.<name>.value
+_PATH = re.compile(r'^\$(?P<dots>\.\.?)(?P<name>\w+)(?:\[(?P<predicate>[^\[\]()]+)\])?(?:\.(?P<field>\w+))?$')
+_TERM = re.compile(r'^@\.(?P<field>\w+)\s*(?P<op>>=|<=|>|<|is not|is)\s*(?P<literal>.+)$')
+_NUMBER = re.compile(r'^-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?$')
+_STRING = re.compile(r'^(?:"(?P<double>[^"]*)"|\'(?P<single>[^\']*)\')$')
+
+_LABEL_FIELDS = CODE_FIELDS + ('name',)
+_OPS = {'>': np.greater, '>=': np.greater_equal, '<': np.less, '<=': np.less_equal,
+        'is': np.equal, 'is not': np.not_equal}
+
+
+def _term(text):
+    match = _TERM.match(text.strip())
+    if match is None:
+        return None
+    field, op, literal = match.group('field', 'op', 'literal')
+    literal = literal.strip()
+
+    if field in FLOAT_FIELDS and _NUMBER.match(literal):
+        return (field, op, float(literal))
+
+    string = _STRING.match(literal)
+    if field in _LABEL_FIELDS and string and op in ('is', 'is not'):
+        return (field, op, string.group('double') if string.group('double') is not None else string.group('single'))
+
+    return None
+
+
+def _predicate(text):
+    # disjunction of conjunctions, 'and' binding tighter than 'or' as in objectpath
+    clauses = []
+    for clause in re.split(r'\s+or\s+', text.strip()):
+        terms = [_term(term) for term in re.split(r'\s+and\s+', clause)]
+        if any(term is None for term in terms):
+            return None
+        clauses.append(tuple(terms))
+    return tuple(clauses)
+
+
+class QueryPlan:
+
+    def __init__(self, query, name, dots, predicate=None, field=None):
+        self.query = query
+        self.name = name
+        self.dots = dots
+        self.predicate = predicate
+        self.field = field
+
+    def __repr__(self):
+        return f'QueryPlan(name={self.name!r}, predicate={self.predicate!r}, field={self.field!r})'
+
+    def _term_mask(self, block, field, op, literal):
+        if field in FLOAT_FIELDS:
+            column = block.column(field)
+            mask = _OPS[op](column, literal)
+            if field != 'value' and op == 'is not':
+                # missing baseline offsets are None in the records and objectpath never matches them
+                mask &= ~np.isnan(column)
+            return mask
+
+        if field == 'name':
+            match = block.name == literal
+            return np.full(block.size, match if op == 'is' else not match)
+
+        code = block.categories[field].codes.get(literal, -1)
+        return _OPS[op](block.column(field), code)
+
+    def mask(self, block):
+        if self.predicate is None:
+            return None
+        mask = np.zeros(block.size, dtype=bool)
+        for clause in self.predicate:
+            clause_mask = np.ones(block.size, dtype=bool)
+            for term in clause:
+                clause_mask &= self._term_mask(block, *term)
+            mask |= clause_mask
+        return mask
+
+    def _project(self, block, rows):
+        if self.field is None:
+            return block.records(rows)
+        return block.values(self.field, rows)
+
+    def run(self, blocks):
+        result = []
+        for block in blocks:
+            mask = self.mask(block)
+            result.extend(self._project(block, None if mask is None else np.flatnonzero(mask)))
+        return tuple(result)
+
+
+@lru_cache(maxsize=1024)
+def compile_query(query):
+    # parse once; None means the expression needs the objectpath fallback
+    match = _PATH.match(query.strip())
+    if match is None:
+        return None
+
+    name, dots, predicate, field = match.group('name', 'dots', 'predicate', 'field')
+    if name in FIELDS or (field is not None and field not in FIELDS):
+        return None
+
+    if predicate is not None:
+        predicate = _predicate(predicate)
+        if predicate is None:
+            return None
+
+    return QueryPlan(query, name, dots, predicate, field)
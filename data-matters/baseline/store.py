@@ -0,0 +1,502 @@
+import struct
+
+import numpy as np
+import pandas as pd
+
+
+TIME_DTYPE = 'datetime64[ns]'
+DAY = np.timedelta64(1, 'D')
+
+FLOAT_FIELDS = ('value', 'baseline_targeted_days', 'baseline_enrolled_days')
+TIME_FIELDS = ('time', 'targeted_date', 'enrolled_date')
+CODE_FIELDS = ('participant', 'description', 'arm')
+
+# date column -> the offset column measured from it
+OFFSETS = {'targeted_date': 'baseline_targeted_days', 'enrolled_date': 'baseline_enrolled_days'}
+
+# what identifies a reading for duplicate checks, the name being implied by its block
+KEY_FIELDS = ('participant', 'time', 'value')
+
+# column order matches the Biomarker dataclass
+FIELDS = ('participant', 'name', 'value', 'time', 'description', 'arm',
+          'targeted_date', 'enrolled_date', 'baseline_targeted_days', 'baseline_enrolled_days')
+
+
+def _to_time(value):
+    if value is None:
+        return np.datetime64('NaT')
+    return np.datetime64(value)
+
+
+def _to_float(value):
+    if value is None:
+        return np.nan
+    return float(value)
+
+
+def _to_times(values):
+    return np.asarray(pd.to_datetime(values), dtype=TIME_DTYPE)
+
+
+DTYPES = dict([(field, np.dtype(np.float64)) for field in FLOAT_FIELDS] +
+              [(field, np.dtype(TIME_DTYPE)) for field in TIME_FIELDS] +
+              [(field, np.dtype(np.int32)) for field in CODE_FIELDS])
+
+
+def _broadcast(column, n):
+    # scalars (e.g. one enrollment date for every row) fill the whole column
+    if column.ndim == 0:
+        return np.full(n, column[()], dtype=column.dtype)
+    return column
+
+
+def as_columns(data, participant=None):
+    # normalize a long-format frame (or mapping of arrays) to typed columns,
+    # deriving both baseline offsets in one vectorized pass
+    columns = {'value': np.asarray(data['value'], dtype=np.float64)}
+    n = len(columns['value'])
+
+    for field in TIME_FIELDS:
+        if field in data:
+            columns[field] = _broadcast(_to_times(data[field]), n)
+        else:
+            columns[field] = np.full(n, np.datetime64('NaT'), dtype=TIME_DTYPE)
+    columns['baseline_targeted_days'] = (columns['time'] - columns['targeted_date']) / DAY
+    columns['baseline_enrolled_days'] = (columns['time'] - columns['enrolled_date']) / DAY
+
+    defaults = {'participant': participant, 'name': None, 'description': '', 'arm': ''}
+    for field, default in defaults.items():
+        if field in data:
+            # pandas factorizes its own string columns faster than object arrays
+            column = data[field]
+            columns[field] = column if isinstance(column, pd.Series) else _broadcast(np.asarray(column, dtype=object), n)
+        else:
+            assert (default is not None), f'missing column {field}'
+            columns[field] = np.full(n, default, dtype=object)
+
+    return columns
+
+
+def group_rows(*codes):
+    # stable sort on the combined integer key, then split on key changes
+    key = np.zeros(len(codes[0]), dtype=np.int64)
+    for code in codes:
+        key = key * (int(code.max(initial=0)) + 1) + code
+    order = np.argsort(key, kind='stable')
+    bounds = np.flatnonzero(np.diff(key[order])) + 1
+    starts = np.concatenate([[0], bounds]).astype(np.intp)
+    stops = np.concatenate([bounds, [len(key)]]).astype(np.intp)
+    if len(key) == 0:
+        starts, stops = starts[:0], stops[:0]
+    return order, starts, stops
+
+
+_MASK = (1 << 64) - 1
+
+
+def _mix(x):
+    # splitmix64 finalizer on uint64 arrays
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def _mix_one(x):
+    # _mix for one python int
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & _MASK
+    return x ^ (x >> 31)
+
+
+def _bits(column):
+    # uint64 image of a column in which equal values have equal bits (-0.0 as 0.0, one NaN)
+    column = np.asarray(column)
+    if column.dtype.kind == 'f':
+        column = column.astype(np.float64) + 0.0
+        column[np.isnan(column)] = np.nan
+        return column.view(np.uint64)
+    if column.dtype.kind in 'Mm':
+        return column.view(np.int64).view(np.uint64)
+    if column.dtype.kind in 'iub':
+        return column.astype(np.int64).view(np.uint64)
+    return pd.util.hash_array(column)
+
+
+def row_hashes(columns, fields):
+    # one uint64 per row combining the hashes of every field
+    row_hash = np.zeros(len(columns['value']), dtype=np.uint64)
+    for field in fields:
+        row_hash = row_hash * np.uint64(1000003) ^ _mix(_bits(columns[field]))
+    return row_hash
+
+
+def key_hash(participant, time, value):
+    # row_hashes over KEY_FIELDS for a single reading: participant code, time as int64 ns, float value
+    value = float(value) + 0.0
+    value = struct.unpack('<Q', struct.pack('<d', np.nan if value != value else value))[0]
+    row_hash = 0
+    for bits in (participant & _MASK, time & _MASK, value):
+        row_hash = ((row_hash * 1000003) & _MASK) ^ _mix_one(bits)
+    return row_hash
+
+
+def first_rows(columns, fields, row_hash=None):
+    # mask keeping the first of every set of exactly equal rows; only rows whose
+    # hashes collide are compared field by field
+    row_hash = row_hashes(columns, fields) if row_hash is None else row_hash
+    keep = np.ones(row_hash.size, dtype=bool)
+    ordered = np.sort(row_hash)
+    collisions = ordered[1:][ordered[1:] == ordered[:-1]]
+    if collisions.size:
+        rows = np.flatnonzero(np.isin(row_hash, collisions))
+        frame = pd.DataFrame({field: np.asarray(columns[field])[rows] for field in fields})
+        keep[rows[frame.duplicated().to_numpy()]] = False
+    return keep
+
+
+def assert_unique(columns, fields):
+    assert first_rows(columns, fields).all(), 'biomarker exists'
+
+
+def _equal(a, b):
+    # elementwise equality with NaN == NaN and NaT == NaT
+    if a.dtype.kind == 'M':
+        a, b = a.view(np.int64), b.view(np.int64)
+    equal = a == b
+    if a.dtype.kind == 'f':
+        equal |= np.isnan(a) & np.isnan(b)
+    return equal
+
+
+class Categories:
+    # dictionary encoder for repeated labels (participant, arm, description)
+
+    def __init__(self, labels=()):
+        self.labels = []
+        self.codes = dict()
+        for label in labels:
+            self.encode(label)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def encode(self, label):
+        code = self.codes.get(label)
+        if code is None:
+            code = len(self.labels)
+            self.codes.update({label: code})
+            self.labels.append(label)
+        return code
+
+    def encode_many(self, labels):
+        if not isinstance(labels, (pd.Series, np.ndarray)):
+            labels = np.asarray(labels, dtype=object)
+        codes, uniques = pd.factorize(labels, use_na_sentinel=False)
+        lookup = np.array([self.encode(label) for label in uniques], dtype=np.int32)
+        return lookup[codes]
+
+    def decode(self, codes):
+        return np.asarray(self.labels, dtype=object)[codes]
+
+
+class HashRuns:
+    # row hashes with their row positions as a few sorted runs (a logarithmic method): new
+    # entries collect in a short unsorted tail, a full tail is sorted into a run and runs of
+    # similar size are merged, so every entry is merged O(log n) times and a lookup is a
+    # binary search per run plus one scan of the tail
+
+    TAIL = 1024
+
+    def __init__(self):
+        self.runs = []
+        self.tail_hashes = np.empty(self.TAIL, dtype=np.uint64)
+        self.tail_rows = np.empty(self.TAIL, dtype=np.int64)
+        self.tail = 0
+
+    def add(self, hashes, rows):
+        n = len(hashes)
+        if self.tail + n <= self.TAIL:
+            self.tail_hashes[self.tail:self.tail + n] = hashes
+            self.tail_rows[self.tail:self.tail + n] = rows
+            self.tail += n
+            return self
+        hashes = np.concatenate([self.tail_hashes[:self.tail], hashes])
+        rows = np.concatenate([self.tail_rows[:self.tail], rows])
+        self.tail = 0
+        order = np.argsort(hashes, kind='stable')
+        hashes, rows = hashes[order], rows[order]
+        while self.runs and len(self.runs[-1][0]) <= 8 * len(hashes):
+            run_hashes, run_rows = self.runs.pop()
+            hashes, rows = np.concatenate([run_hashes, hashes]), np.concatenate([run_rows, rows])
+            order = np.argsort(hashes, kind='stable')
+            hashes, rows = hashes[order], rows[order]
+        self.runs.append((hashes, rows))
+        return self
+
+    def add_one(self, key, row):
+        if self.tail == self.TAIL:
+            return self.add(np.array([key], dtype=np.uint64), np.array([row], dtype=np.int64))
+        self.tail_hashes[self.tail] = key
+        self.tail_rows[self.tail] = row
+        self.tail += 1
+        return self
+
+    def find(self, key):
+        # rows of one hash
+        key = np.uint64(key)
+        rows = []
+        for run_hashes, run_rows in self.runs:
+            at = run_hashes.searchsorted(key)
+            while at < len(run_hashes) and run_hashes[at] == key:
+                rows.append(int(run_rows[at]))
+                at += 1
+        rows.extend(self.tail_rows[:self.tail][self.tail_hashes[:self.tail] == key].tolist())
+        return rows
+
+    def lookup(self, hashes):
+        # (i, row) for every stored row whose hash equals hashes[i]; the tail is searched
+        # through a sorted copy, so memory stays linear in the number of hashes
+        order = np.argsort(self.tail_hashes[:self.tail], kind='stable')
+        tail = (self.tail_hashes[:self.tail][order], self.tail_rows[:self.tail][order])
+        found = []
+        for run_hashes, run_rows in self.runs + [tail]:
+            start = run_hashes.searchsorted(hashes, 'left')
+            count = run_hashes.searchsorted(hashes, 'right') - start
+            i = np.repeat(np.arange(len(hashes)), count)
+            offset = np.arange(len(i)) - np.repeat(np.cumsum(count) - count, count)
+            found.append((i, run_rows[np.repeat(start, count) + offset]))
+        return [np.concatenate(x) for x in zip(*found)]
+
+
+class BiomarkerColumns:
+    # append-only columnar storage for all readings of one biomarker name
+
+    def __init__(self, name, categories=None, capacity=16, columns=None):
+        self.name = name
+        if categories is None:
+            categories = {field: Categories() for field in CODE_FIELDS}
+        self.categories = categories
+        if columns is None:
+            self.size = 0
+            self.arrays = {field: np.empty(capacity, dtype=dtype) for field, dtype in DTYPES.items()}
+        else:
+            # adopt already typed and encoded columns without copying
+            self.size = len(columns['value'])
+            self.arrays = {field: np.asarray(columns[field], dtype=dtype) for field, dtype in DTYPES.items()}
+
+        # row hashes of (participant, time, value) for duplicate checks, built on first use
+        self.hashes = None
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self.arrays['value'])
+
+    def _reserve(self, size):
+        # grow geometrically so appends are amortized O(1)
+        if size <= self.capacity:
+            return self
+        capacity = max(size, 2 * self.capacity)
+        for field, array in self.arrays.items():
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.arrays[field] = grown
+        return self
+
+    def column(self, field):
+        if field == 'name':
+            return np.full(self.size, self.name, dtype=object)
+        return self.arrays[field][:self.size]
+
+    def labels(self, field, rows=None):
+        # decoded view of a dictionary encoded column
+        column = self.column(field)
+        if rows is not None:
+            column = column[rows]
+        if field in CODE_FIELDS:
+            return self.categories[field].decode(column)
+        return column
+
+    def marker_hash(self, marker):
+        # key_hash of a Biomarker, its participant encoded as append will
+        time = int(_to_time(marker.time).astype(TIME_DTYPE).view(np.int64))
+        return key_hash(self.categories['participant'].encode(marker.participant), time, _to_float(marker.value))
+
+    def append(self, marker, row_hash=None):
+        self._reserve(self.size + 1)
+        i = self.size
+        for field in FLOAT_FIELDS:
+            self.arrays[field][i] = _to_float(getattr(marker, field))
+        for field in TIME_FIELDS:
+            self.arrays[field][i] = _to_time(getattr(marker, field))
+        for field in CODE_FIELDS:
+            self.arrays[field][i] = self.categories[field].encode(getattr(marker, field))
+        self.size += 1
+
+        if self.hashes is not None:
+            self.hashes.add_one(self.marker_hash(marker) if row_hash is None else row_hash, i)
+        return i
+
+    def _hashes(self):
+        if self.hashes is None:
+            keys = {field: self.column(field) for field in KEY_FIELDS}
+            self.hashes = HashRuns().add(row_hashes(keys, KEY_FIELDS), np.arange(self.size, dtype=np.int64))
+        return self.hashes
+
+    def stored(self, columns, row_hash=None, fields=None):
+        # mask of rows in typed, encoded columns that equal a stored row in every one of
+        # fields (all by default); row_hash is row_hashes over KEY_FIELDS. costs a lookup
+        # per new row, not a pass over the stored ones
+        fields = self.arrays.keys() if fields is None else fields
+        row_hash = row_hashes(columns, KEY_FIELDS) if row_hash is None else row_hash
+        i, rows = self._hashes().lookup(row_hash)
+        found = np.zeros(len(row_hash), dtype=bool)
+        if not len(i):
+            return found
+        equal = np.ones(len(i), dtype=bool)
+        for field in fields:
+            equal &= _equal(np.asarray(columns[field])[i], self.arrays[field][rows])
+        found[i[equal]] = True
+        return found
+
+    def extend(self, columns, row_hash=None, check=True):
+        # bulk append of typed columns, code fields already encoded (row_hash, when given,
+        # is row_hashes over KEY_FIELDS); an empty block takes rows as given, callers check
+        # the batch as a whole, and check=False skips the checks for callers that deduped
+        n = len(columns['value'])
+        if row_hash is None and ((self.size and check) or self.hashes is not None):
+            row_hash = row_hashes(columns, KEY_FIELDS)
+        if self.size:
+            if check:
+                assert first_rows(columns, self.arrays.keys(), row_hash).all(), 'biomarker exists'
+                assert (not self.stored(columns, row_hash).any()), 'biomarker exists'
+            self._reserve(self.size + n)
+            for field, array in self.arrays.items():
+                array[self.size:self.size + n] = columns[field]
+        else:
+            self.arrays = {field: np.asarray(columns[field], dtype=dtype) for field, dtype in DTYPES.items()}
+        if self.hashes is not None:
+            self.hashes.add(row_hash, np.arange(self.size, self.size + n, dtype=np.int64))
+        self.size += n
+        return self
+
+    def _row_equals(self, i, marker):
+        for field in FLOAT_FIELDS:
+            value, stored = _to_float(getattr(marker, field)), self.arrays[field][i]
+            if not (value == stored or (value != value and stored != stored)):
+                return False
+        for field in TIME_FIELDS:
+            value, stored = _to_time(getattr(marker, field)), self.arrays[field][i]
+            if not (value == stored or (np.isnat(value) and np.isnat(stored))):
+                return False
+        for field in CODE_FIELDS:
+            if self.categories[field].codes.get(getattr(marker, field)) != self.arrays[field][i]:
+                return False
+        return True
+
+    def find(self, marker, row_hash=None):
+        # positions of rows equal to marker in every field, among those sharing its key hash
+        row_hash = self.marker_hash(marker) if row_hash is None else row_hash
+        rows = [i for i in self._hashes().find(row_hash) if self._row_equals(i, marker)]
+        return np.array(rows, dtype=np.intp)
+
+    def _writable(self, field):
+        # adopted columns (memory mapped read only, borrowed from a frame) are copied once
+        array = self.arrays[field]
+        if not array.flags.writeable:
+            array = self.arrays[field] = array.copy()
+        return array
+
+    def rebase(self, field, anchor=None):
+        # in place: set the date column (targeted_date / enrolled_date) to anchor, a date or
+        # one per row, or keep it with None, then recompute its offset column
+        if anchor is not None:
+            self._writable(field)[:self.size] = anchor
+        self._writable(OFFSETS[field])[:self.size] = (self.column('time') - self.column(field)) / DAY
+        return self
+
+    def values(self, field, rows=None):
+        # python values as they appear in the row dicts
+        column = self.labels(field, rows)
+        if field in ('baseline_targeted_days', 'baseline_enrolled_days'):
+            return [None if x != x else x for x in column.tolist()]
+        if field in TIME_FIELDS:
+            return [None if np.isnat(x) else x for x in column]
+        return column.tolist()
+
+    def records(self, rows=None):
+        # rebuild the row dicts that Participant.biomarkers used to hold
+        columns = {field: self.values(field, rows) for field in FIELDS}
+        return [dict(zip(FIELDS, row)) for row in zip(*[columns[field] for field in FIELDS])]
+
+    def as_dataframe(self):
+        return frame([(self, 0, self.size)])
+
+
+def frame_columns(chunks):
+    # raw columns for (block, start, stop) row ranges, decoding labels once per
+    # distinct set of categories
+    chunks = [(block, start, stop) for block, start, stop in chunks if stop > start]
+    columns = dict()
+    for field in FLOAT_FIELDS + TIME_FIELDS:
+        columns[field] = np.concatenate([block.column(field)[start:stop] for block, start, stop in chunks]
+                                        or [np.empty(0, dtype=DTYPES[field])])
+    columns['name'] = np.repeat(np.array([block.name for block, _, _ in chunks] or [''], dtype=object),
+                                [stop - start for _, start, stop in chunks] or [0])
+
+    shared = len(set(id(block.categories) for block, _, _ in chunks)) <= 1
+    for field in CODE_FIELDS:
+        if shared and chunks:
+            codes = np.concatenate([block.column(field)[start:stop] for block, start, stop in chunks])
+            columns[field] = chunks[0][0].categories[field].decode(codes)
+        else:
+            columns[field] = np.concatenate([block.labels(field)[start:stop] for block, start, stop in chunks]
+                                            or [np.empty(0, dtype=object)])
+
+    return {field: columns[field] for field in FIELDS}
+
+
+def frame(chunks):
+    return pd.DataFrame(frame_columns(chunks))
+
+
+class FrameBuffer:
+    # a growing frame: numeric and time columns live in buffers whose capacity doubles,
+    # labels in pandas string arrays whose concatenation only adds a chunk (pyarrow
+    # storage), so appending costs the new rows rather than a copy of the whole frame
+
+    def __init__(self):
+        self.columns = dict()
+        self.size = 0
+
+    def append(self, columns):
+        n, m = self.size, len(columns['value'])
+        for field, column in columns.items():
+            if column.dtype.kind == 'O':
+                new = pd.Series(column, copy=False)
+                self.columns[field] = new if n == 0 else pd.concat([self.columns[field], new], ignore_index=True)
+                continue
+            buffer = self.columns.get(field)
+            if buffer is None or len(buffer) < n + m:
+                grown = np.empty(max(n + m, 2 * n), dtype=column.dtype)
+                if buffer is not None:
+                    grown[:n] = buffer[:n]
+                self.columns[field] = buffer = grown
+            buffer[n:n + m] = column
+        self.size = n + m
+        return self
+
+    def take(self, rows):
+        # a new buffer holding rows in the given order
+        taken = FrameBuffer()
+        taken.columns = {field: column.take(rows).reset_index(drop=True) if isinstance(column, pd.Series)
+                         else column[:self.size][rows] for field, column in self.columns.items()}
+        taken.size = len(rows)
+        return taken
+
+    def frame(self):
+        # rows already handed out are never written again, so the frame can view the buffers
+        return pd.DataFrame({field: column if isinstance(column, pd.Series) else column[:self.size]
+                             for field, column in self.columns.items()}, copy=False)
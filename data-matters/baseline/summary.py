@@ -0,0 +1,117 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class Summary:
+    n: int
+    n_missing: int
+    mean: float
+    std: float
+    median: float
+    ci_low: float
+    ci_high: float
+    mode: float
+    mode_count: int
+    # distinct values and their counts (StudyStats._cat_count / _gap_frac), ascending
+    unique: np.ndarray
+    counts: np.ndarray
+
+
+# the per-group statistics of summarize_groups
+GROUP_FIELDS = ('n', 'n_missing', 'mean', 'std', 'median', 'ci_low', 'ci_high', 'mode', 'mode_count')
+
+
+def _strip(values):
+    # one contiguous float copy without NaNs, shared by every statistic
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    return values[~np.isnan(values)], values.size
+
+
+def _interpolate(ordered, position):
+    # numpy's default 'linear' percentile from (partially) ordered values
+    low = np.floor(position).astype(np.intp)
+    high = np.minimum(low + 1, len(ordered) - 1)
+    frac = position - low
+    return ordered[low] + frac * (ordered[high] - ordered[low])
+
+
+def summarize(values, low=2.5, high=97.5):
+    values, total = _strip(values)
+    n = values.size
+    if n == 0:
+        return Summary(0, total, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, 0, values, np.zeros(0, dtype=np.int64))
+
+    mean = values.mean()
+    std = np.sqrt(np.mean((values - mean) ** 2))
+
+    # a single partition places every order statistic the percentiles need
+    positions = np.array([0.5, low / 100, high / 100]) * (n - 1)
+    kth = np.unique(np.concatenate([np.floor(positions), np.minimum(np.floor(positions) + 1, n - 1)]).astype(np.intp))
+    ordered = np.partition(values, kth)
+    median, ci_low, ci_high = _interpolate(ordered, positions)
+
+    unique, counts = np.unique(values, return_counts=True)
+    mode = counts.argmax()
+
+    return Summary(n, total - n, mean, std, median, ci_low, ci_high, unique[mode], int(counts[mode]), unique, counts)
+
+
+def _segments(codes):
+    # start of every run of equal consecutive codes
+    return np.flatnonzero(np.concatenate([[True], codes[1:] != codes[:-1]]))
+
+
+def _group_order(values, codes):
+    # order by (group, value): sort values, then a stable sort on the group codes, which
+    # numpy does as a radix sort when the codes fit 16 bits; equal to lexsort((values, codes))
+    # up to the order of tied values
+    order = np.argsort(values)
+    if codes.size and 0 <= codes.min() and codes.max() < 2 ** 16:
+        return order[np.argsort(codes.astype(np.uint16)[order], kind='stable')]
+    return order[np.argsort(codes[order], kind='stable')]
+
+
+def summarize_groups(values, codes, low=2.5, high=97.5):
+    # segmented reductions over values sorted by (group, value); no loop over groups.
+    # returns the group codes present and a dict of per-group statistic arrays
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    codes = np.asarray(codes, dtype=np.int64)
+    keep = ~np.isnan(values)
+    missing = np.bincount(codes[~keep], minlength=codes.max(initial=-1) + 1)
+    values, codes = values[keep], codes[keep]
+    if codes.size == 0:
+        empty = np.empty(0)
+        return codes, dict((field, empty) for field in GROUP_FIELDS)
+
+    order = _group_order(values, codes)
+    values, codes = values[order], codes[order]
+    starts = _segments(codes)
+    groups = codes[starts]
+    n = np.diff(np.append(starts, codes.size))
+
+    mean = np.add.reduceat(values, starts) / n
+    std = np.sqrt(np.add.reduceat((values - np.repeat(mean, n)) ** 2, starts) / n)
+
+    # values are sorted within each group, so percentiles are direct lookups
+    median, ci_low, ci_high = [_interpolate(values, starts + q / 100 * (n - 1)) for q in (50, low, high)]
+
+    # runs of equal (group, value); the longest run per group, ties to the smallest value
+    runs = np.flatnonzero(np.concatenate([[True], (codes[1:] != codes[:-1]) | (values[1:] != values[:-1])]))
+    run_counts = np.diff(np.append(runs, codes.size))
+    run_groups = codes[runs]
+    best = np.lexsort((runs, -run_counts, run_groups))
+    best = best[_segments(run_groups[best])]
+
+    return groups, {
+        'n': n,
+        'n_missing': missing[groups],
+        'mean': mean,
+        'std': std,
+        'median': median,
+        'ci_low': ci_low,
+        'ci_high': ci_high,
+        'mode': values[runs[best]],
+        'mode_count': run_counts[best],
+    }
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ..baseline import Participant, Study
+from .test_regression import readings, same
+
+
+@pytest.fixture
+def study():
+    study = Study.from_dataframe('study', readings())
+    # a participant with its own label categories
+    part = Participant('e')
+    part.add_measurements(pd.DataFrame({'name': ['tg'], 'value': [3.0], 'time': pd.to_datetime(['2020-05-01']),
+                                        'arm': 'z', 'description': 'own'}))
+    return study._add_participant(part)
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_save_load_round_trip(study, tmp_path, mmap):
+    loaded = Study.load(study.save(tmp_path / 'study'), mmap=mmap)
+    assert loaded.name == study.name
+    assert list(loaded.participants.keys()) == list(study.participants.keys())
+    assert loaded.as_dataframe().equals(study.as_dataframe())
+    for name in study.participants.keys():
+        part, other = study.participants[name][0], loaded.participants[name][0]
+        assert list(other.store.keys()) == list(part.store.keys())
+        assert same(other.bio_query('$.ldl'), part.bio_query('$.ldl'))
+    assert same(loaded.bio_query('$..ldl[@.value > 2].value'), study.bio_query('$..ldl[@.value > 2].value'))
+
+
+def test_loaded_study_changes_stay_in_memory(study, tmp_path):
+    path = study.save(tmp_path / 'study')
+    loaded = Study.load(path)
+    loaded.rebaseline(enrolled_date='2019-06-01')
+    loaded.upsert(pd.DataFrame({'participant': ['a'], 'name': ['ldl'], 'value': [8.0],
+                                'time': pd.to_datetime(['2020-06-01']), 'arm': 'x'}))
+    assert len(loaded.as_dataframe()) == len(study.as_dataframe()) + 1
+
+    # copy-on-write maps leave the saved columns untouched
+    assert Study.load(path).as_dataframe().equals(study.as_dataframe())
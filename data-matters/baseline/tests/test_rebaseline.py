@@ -0,0 +1,44 @@
+import numpy as np
+
+from ..baseline import Study
+from .test_regression import canon, readings
+
+
+DAY = np.timedelta64(1, 'D')
+
+
+def offsets(frame):
+    return ((frame['time'] - frame['enrolled_date']) / DAY).to_numpy()
+
+
+def test_rebaseline_dates_and_offsets():
+    study = Study.from_dataframe('study', readings())
+    study.rebaseline(participants=['a'], enrolled_date='2019-06-01')
+    frame = study.as_dataframe()
+    moved = frame['participant'] == 'a'
+    assert (frame.loc[moved, 'enrolled_date'] == np.datetime64('2019-06-01')).all()
+    assert (frame.loc[~moved, 'enrolled_date'] == np.datetime64('2019-12-01')).all()
+    np.testing.assert_array_equal(frame['baseline_enrolled_days'].to_numpy(), offsets(frame))
+
+
+def test_rebaseline_mapping_and_first():
+    study = Study.from_dataframe('study', readings())
+    study.rebaseline(enrolled_date={'a': 'first', 'c': '2020-01-01'})
+    frame = study.as_dataframe().set_index('participant')
+    assert (frame.loc['a', 'enrolled_date'] == np.datetime64('2020-01-01')).all()
+    assert (frame.loc['b', 'enrolled_date'] == np.datetime64('2019-12-01')).all()
+    assert (frame.loc['c', 'enrolled_date'] == np.datetime64('2020-01-01')).all()
+    assert frame.loc['a', 'baseline_enrolled_days'].min() == 0.0
+
+
+def test_rebaseline_refreshes_index_and_frame():
+    study = Study.from_dataframe('study', readings())
+    study.as_dataframe()
+    study.select(name='ldl', time_range=(0, 60), on='baseline_enrolled_days')
+    study.rebaseline(enrolled_date='first')
+
+    fresh = Study.from_dataframe('study', study.as_dataframe())
+    assert study.as_dataframe().equals(fresh.as_dataframe())
+    for query in [dict(name='ldl', time_range=(0, 10)), dict(arm='x', time_range=(1, None))]:
+        selected = study.select(on='baseline_enrolled_days', **query)
+        assert len(selected) and canon(selected).equals(canon(fresh.select(on='baseline_enrolled_days', **query)))
@@ -0,0 +1,77 @@
+import numpy as np
+import objectpath
+import pandas as pd
+import pytest
+
+from ..baseline import Biomarker, Participant, Study
+
+
+# compiled query shapes, see query.py
+STUDY_QUERIES = [
+    '$..ldl',
+    '$..ldl.value',
+    '$..hdl.arm',
+    '$..ldl[@.value > 2]',
+    '$..ldl[@.value <= 3.5].time',
+    '$..hdl[@.arm is "x"].value',
+    '$..ldl[@.arm is not "x" and @.value >= 1].participant',
+    '$..ldl[@.value > 4 or @.arm is "x"].value',
+    '$..missing',
+]
+PARTICIPANT_QUERIES = ['$.ldl', '$.ldl.value', '$.ldl.time', '$..hdl[@.value >= 2].value']
+
+
+def readings():
+    # three participants, a NaN value, a missing time and an empty description
+    return pd.DataFrame({
+        'participant': ['a', 'a', 'a', 'b', 'b', 'c', 'c'],
+        'name': ['ldl', 'hdl', 'ldl', 'ldl', 'ldl', 'hdl', 'ldl'],
+        'value': [1.0, 2.0, 4.5, 3.5, np.nan, 5.0, 2.5],
+        'time': pd.to_datetime(['2020-01-01', '2020-01-02', '2020-02-01', '2020-01-03', None, '2020-01-05', '2020-01-06']),
+        'description': ['', 'fasting', '', '', '', 'fasting', ''],
+        'arm': ['x', 'x', 'x', 'y', 'y', 'x', 'y'],
+        'enrolled_date': pd.Timestamp('2019-12-01'),
+    })
+
+
+def same(a, b):
+    # equal results, NaN and NaT included
+    return pd.DataFrame(list(a)).equals(pd.DataFrame(list(b)))
+
+
+def canon(frame):
+    return frame.sort_values(['participant', 'name', 'time', 'value']).reset_index(drop=True)
+
+
+@pytest.fixture
+def study():
+    return Study.from_dataframe('study', readings())
+
+
+@pytest.mark.parametrize('query', STUDY_QUERIES)
+def test_study_compiled_matches_objectpath(study, query):
+    assert (study._compiled(query) is not None or query == '$..missing')
+    assert same(study.bio_query(query), study.bio_query(query, override=study.data))
+
+
+@pytest.mark.parametrize('query', PARTICIPANT_QUERIES)
+def test_participant_compiled_matches_objectpath(study, query):
+    for part in study.participants.values():
+        part = part[0]
+        assert same(part.bio_query(query), objectpath.Tree(part.biomarkers).execute(query))
+
+
+def test_from_dataframe_matches_biomarker_ingest(study):
+    participants = dict()
+    for record in readings().to_dict('records'):
+        record.update({'time': record['time'].to_datetime64(), 'enrolled_date': record['enrolled_date'].to_datetime64()})
+        part = participants.setdefault(record['participant'], Participant(record['participant']))
+        part._add_measurement(Biomarker(**record))
+    ingested = Study('study')._add_participants(participants.values())
+
+    assert list(ingested.participants.keys()) == list(study.participants.keys())
+    assert canon(ingested.as_dataframe()).equals(canon(study.as_dataframe()))
+    for name in study.participants.keys():
+        part, other = study.participants[name][0], ingested.participants[name][0]
+        assert list(part.store.keys()) == list(other.store.keys())
+        assert same(part.as_dataframe().to_dict('records'), other.as_dataframe().to_dict('records'))
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ..baseline import Biomarker, Participant, Study
+from .test_regression import canon, readings
+
+
+KEY = ['participant', 'name', 'time', 'value']
+
+
+def delta():
+    # a new participant, a new reading of a known one, a stored reading re-delivered with
+    # another arm and description, a stored NaN reading and a repeat within the batch
+    return pd.DataFrame({
+        'participant': ['d', 'a', 'a', 'b', 'd'],
+        'name': ['ldl', 'ldl', 'hdl', 'ldl', 'ldl'],
+        'value': [7.0, 6.0, 2.0, np.nan, 7.0],
+        'time': pd.to_datetime(['2020-03-01', '2020-03-02', '2020-01-02', None, '2020-03-01']),
+        'description': ['', '', 'changed', '', ''],
+        'arm': ['y', 'x', 'y', 'y', 'y'],
+        'enrolled_date': pd.Timestamp('2019-12-01'),
+    })
+
+
+def expected(*frames):
+    # the first delivery of every (participant, name, time, value) reading
+    return Study.from_dataframe('study', pd.concat(frames).drop_duplicates(KEY))
+
+
+def test_upsert_keys_readings_on_participant_name_time_value():
+    study = Study.from_dataframe('study', readings()).upsert(delta())
+    assert len(study.as_dataframe()) == len(readings()) + 2
+    assert canon(study.as_dataframe()).equals(canon(expected(readings(), delta()).as_dataframe()))
+
+    # a second delivery changes nothing
+    version = study.version
+    study.upsert(delta())
+    assert study.version == version and len(study.as_dataframe()) == len(readings()) + 2
+
+
+def test_add_measurement_compares_every_field():
+    part = Study.from_dataframe('study', readings()).participants['a'][0]
+    record = readings().iloc[0].to_dict()
+    record.update({'time': record['time'].to_datetime64(), 'enrolled_date': record['enrolled_date'].to_datetime64()})
+    with pytest.raises(AssertionError, match='biomarker exists'):
+        part._add_measurement(Biomarker(**record))
+    part._add_measurement(Biomarker(**dict(record, description='repeat')))
+    assert part.store['ldl'].size == 3
+
+
+def test_add_participant_merges_known_participants():
+    study = Study.from_dataframe('study', readings())
+    part = Participant('a')
+    part.add_measurements(pd.DataFrame({'name': ['ldl', 'tg'], 'value': [1.0, 9.0],
+                                        'time': pd.to_datetime(['2020-01-01', '2020-04-01']), 'arm': 'x',
+                                        'enrolled_date': pd.Timestamp('2019-12-01')}))
+    study._add_participant(part)._add_participant(part)
+
+    merged = study.participants['a'][0]
+    assert merged is not part and list(merged.store.keys()) == ['ldl', 'hdl', 'tg']
+    assert len(study.as_dataframe()) == len(readings()) + 1
+
+
+def test_upsert_keeps_index_and_frame_current():
+    study = Study.from_dataframe('study', readings())
+    study.as_dataframe()
+    study.select(name='ldl')
+    study.upsert(delta())
+
+    fresh = expected(readings(), delta())
+    assert study.as_dataframe().equals(fresh.as_dataframe())
+    for query in [dict(name='ldl'), dict(arm='y'), dict(name='ldl', time_range=('2020-01-04', None))]:
+        assert canon(study.select(**query)).equals(canon(fresh.select(**query)))
+
+
+def test_upsert_after_rebaseline_skips_redelivered_readings():
+    # rebaselined rows differ from the feed in their dates and offsets, not in their key
+    study = Study.from_dataframe('study', readings()).rebaseline(enrolled_date='2019-06-01')
+    study.upsert(readings())
+    assert len(study.as_dataframe()) == len(readings())
+    assert (study.as_dataframe()['enrolled_date'] == np.datetime64('2019-06-01')).all()
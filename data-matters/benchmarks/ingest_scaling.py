@@ -0,0 +1,29 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from baseline.baseline import Biomarker, Participant
+
+
+# readings of a single biomarker for a single participant; the time per
+# reading should stay flat as n grows if ingest is linear overall
+def ingest(n):
+    times = np.datetime64('2000-01-01T00:00') + np.arange(n).astype('timedelta64[m]')
+    markers = [Biomarker('p0', 'ldl', float(i % 200), times[i], arm='a', enrolled_date='2000-01-01')
+               for i in range(n)]
+
+    part = Participant('p0')
+    start = time.perf_counter()
+    for marker in markers:
+        part._add_measurement(marker)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    for n in (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6):
+        elapsed = ingest(n)
+        print(f'{n:>9,d} readings  {elapsed:8.3f} s  {1e6 * elapsed / n:6.2f} us/reading')
@@ -0,0 +1,169 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.linalg import expm
+from scipy.optimize import least_squares
+
+from .churn import PARAMETERS, ChurnModel, _operators
+from .transfer import TransferMatrixModel
+
+
+# rates a nightly recalibration fits by default; the rest stay as given
+FIT = ('k_churn', 'k_avail_prog', 'k_prog_avail')
+
+
+@dataclass
+class Fit:
+    params: dict
+    cost: float
+    success: bool
+    nfev: int
+    model: object
+
+
+def _propagators(t, G):
+    # exp(dt G) for every step, one expm per distinct step length (one for a uniform grid)
+    steps = np.round(np.diff(t), 12)
+    unique, inverse = np.unique(steps, return_inverse=True)
+    return [expm(dt * G) for dt in unique], inverse
+
+
+def _sensitivities(params, fit, z0, t):
+    # trajectory z(t) and its exact derivatives dz/dp for the fitted parameters, from the
+    # linear sensitivity system d(s_i)/dt = A s_i + (dA/dp_i) z + db/dp_i solved together
+    # with z as one augmented linear ODE. A and b are affine in each parameter separately,
+    # so unit differences of _operators give dA/dp_i, db/dp_i exactly
+    A, b = _operators(params)
+    m = len(fit)
+    n = 3 + 3 * m + 1
+    G = np.zeros((n, n))
+    G[:3, :3] = A
+    G[:3, -1] = b
+    for i, j in enumerate(fit):
+        shifted = params.copy()
+        shifted[j] += 1.0
+        dA, db = _operators(shifted)
+        rows = slice(3 + 3 * i, 6 + 3 * i)
+        G[rows, rows] = A
+        G[rows, :3] = dA - A
+        G[rows, -1] = db - b
+
+    y = np.zeros((len(t), n))
+    y[0, :3] = z0
+    y[0, -1] = 1.0
+    propagators, which = _propagators(t, G)
+    for step, k in enumerate(which):
+        np.dot(propagators[k], y[step], out=y[step + 1])
+    return y[:, :3], y[:, 3:-1].reshape(len(t), m, 3).transpose(0, 2, 1)
+
+
+def _fit_churn(args):
+    # one least-squares run from one start; observed is (T, len(columns))
+    params, fit, start, z0, t, observed, columns, weights = args
+    params = params.copy()
+
+    def residuals(x):
+        params[fit] = x
+        z, _ = _sensitivities(params, fit, z0, t)
+        return ((z[:, columns] - observed) * weights).ravel()
+
+    def jacobian(x):
+        params[fit] = x
+        _, s = _sensitivities(params, fit, z0, t)
+        return (s[:, columns, :] * weights[..., None]).reshape(-1, len(fit))
+
+    result = least_squares(residuals, start, jac=jacobian, bounds=(0.0, np.inf), x_scale='jac', method='trf')
+    return result.x, float(result.cost), bool(result.success), int(result.nfev)
+
+
+def _starts(start, n_starts, spread, seed):
+    # the warm start first, then log-normal perturbations of it
+    rng = np.random.default_rng(seed)
+    start = np.asarray(start, dtype=np.float64)
+    scale = np.where(start > 0, start, 1e-3)
+    jitter = scale * np.exp(rng.normal(0.0, spread, (max(n_starts - 1, 0), start.size)))
+    return [start] + list(jitter)
+
+
+def _map(function, args, workers):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(args) <= 1:
+        return [function(a) for a in args]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(function, args, chunksize=max(1, len(args) // (4 * workers))))
+
+
+def fit_churn(t, observed, z0, model, fit=FIT, columns=(0, 1, 2), weights=None, start=None,
+              n_starts=4, spread=1.0, seed=0, workers=1):
+    # estimate churn model rates from observed compartments (T, len(columns)) at times t.
+    # model supplies the fixed rates (Q_in is not fitted by default) and, unless start is
+    # given, the warm start (e.g. last night's fit); n_starts - 1 perturbed starts guard
+    # against local minima
+    params = model.params
+    fit_index = np.array([PARAMETERS.index(name) for name in fit])
+    columns = list(columns)
+    observed = np.asarray(observed, dtype=np.float64)
+    if observed.ndim == 1 and len(columns) == 1:
+        observed = observed[:, None]
+    assert (observed.shape == (len(t), len(columns))), f'observed is (T, {len(columns)}), got {observed.shape}'
+    weights = np.ones(len(columns)) if weights is None else np.asarray(weights, dtype=np.float64)
+    start = params[fit_index] if start is None else np.asarray(start, dtype=np.float64)
+
+    t = np.asarray(t, dtype=np.float64)
+    z0 = np.asarray(z0, dtype=np.float64)
+    args = [(params, fit_index, x0, z0, t, observed, columns, weights) for x0 in _starts(start, n_starts, spread, seed)]
+    results = _map(_fit_churn, args, workers)
+
+    x, cost, success, _ = min(results, key=lambda r: r[1])
+    fitted = dict(zip(PARAMETERS, params.tolist()))
+    fitted.update(zip(fit, x.tolist()))
+    return Fit(fitted, cost, success, sum(r[3] for r in results), ChurnModel(**fitted))
+
+
+def _fit_churn_task(kwargs):
+    return fit_churn(**kwargs)
+
+
+def fit_churn_many(tasks, workers=None):
+    # one fit_churn per market (a dict of its arguments), spread across processes
+    return _map(_fit_churn_task, [dict(task, workers=1) for task in tasks], workers)
+
+
+def fit_transfer(states, mask=None, start=None):
+    # transfer fractions from an observed (N + 1, k) state series, one row per period, or
+    # (C, N + 1, k) series of several cohorts sharing the matrix (one series alone rarely
+    # pins down every fraction; a mask of known routes helps too). mask marks the allowed
+    # off-diagonal transitions (target, source); the diagonal is what stays, 1 - the
+    # column's outflow, so every fitted column sums to 1. residuals T x_n - x_{n+1} are
+    # linear in the fractions, so the Jacobian is constant
+    states = np.asarray(states, dtype=np.float64)
+    if states.ndim == 2:
+        states = states[None]
+    k = states.shape[-1]
+    mask = ~np.eye(k, dtype=bool) if mask is None else np.asarray(mask, dtype=bool) & ~np.eye(k, dtype=bool)
+    targets, sources = np.nonzero(mask)
+    before, after = states[:, :-1].reshape(-1, k), states[:, 1:].reshape(-1, k)
+
+    # d(T x_n)_i / d T[i, j] = x_n[j], and through the diagonal d(T x_n)_j / d T[i, j] = -x_n[j]
+    jac = np.zeros((before.shape[0], k, targets.size))
+    columns = np.arange(targets.size)
+    jac[:, targets, columns] = before[:, sources]
+    jac[:, sources, columns] -= before[:, sources]
+    jac = jac.reshape(-1, targets.size)
+
+    def matrix(x):
+        T = np.zeros((k, k))
+        T[targets, sources] = x
+        T[np.arange(k), np.arange(k)] = 1.0 - T.sum(axis=0)
+        return T
+
+    def residuals(x):
+        return (before @ matrix(x).T - after).ravel()
+
+    x0 = np.full(targets.size, 0.5 / max(mask.sum(axis=0).max(), 1)) if start is None else np.asarray(start)[targets, sources]
+    result = least_squares(residuals, x0, jac=lambda x: jac, bounds=(0.0, 1.0), method='trf')
+    T = matrix(result.x)
+    return Fit({(int(i), int(j)): float(v) for i, j, v in zip(targets, sources, result.x)}, float(result.cost),
+               bool(result.success), int(result.nfev), TransferMatrixModel(T))
@@ -0,0 +1,199 @@
+import numpy as np
+from dataclasses import dataclass
+from scipy.integrate import odeint, solve_ivp
+from scipy.linalg import expm
+
+from .schedule import breakpoints
+
+
+def annual_rate(fraction, days=365):
+    # first order rate (1/d) that removes `fraction` of a pool over `days`
+    return -np.log(1 - fraction) / days
+
+
+PARAMETERS = ('Q_in', 'k_churn', 'k_churn_prog', 'k_avail_prog', 'k_prog_avail', 'f_prog')
+
+
+def _operators(params):
+    # params (S, 6) in PARAMETERS order -> A (S, 3, 3), b (S, 3) of dz/dt = A z + b
+    Q_in, k_churn, k_churn_prog, k_avail_prog, k_prog_avail, f_prog = np.moveaxis(params, -1, 0)
+    enroll = k_avail_prog * f_prog
+    A = np.zeros(params.shape[:-1] + (3, 3))
+    A[..., 0, 1] = -k_churn
+    A[..., 0, 2] = -k_churn_prog
+    A[..., 1, 1] = -(enroll + k_churn)
+    A[..., 1, 2] = k_prog_avail - k_churn_prog
+    A[..., 2, 1] = enroll
+    A[..., 2, 2] = -(k_prog_avail + k_churn_prog)
+    b = np.zeros(params.shape[:-1] + (3,))
+    b[..., 0] = Q_in
+    b[..., 1] = Q_in
+    return A, b
+
+
+def _augmented(A, b):
+    # (avail, prog, 1) evolves under a 3x3 augmented operator, the book total is the
+    # integral of r . (avail, prog, 1)
+    M = np.zeros(A.shape[:-2] + (3, 3))
+    M[..., :2, :2] = A[..., 1:, 1:]
+    M[..., :2, 2] = b[..., 1:]
+    r = np.stack([A[..., 0, 1], A[..., 0, 2], b[..., 0]], axis=-1)
+    return M, r
+
+
+def _expm_solve(A, b, z0, tau):
+    # defective operators: exponentiate the 4x4 augmented system at every time at once
+    augmented = np.zeros((4, 4))
+    augmented[:3, :3] = A
+    augmented[:3, 3] = b
+    return (expm(tau[:, None, None] * augmented) @ np.append(z0, 1.0))[:, :3]
+
+
+def _closed_form(A, b, z0, tau, out):
+    # exact trajectories for a stack of scenarios from the eigenmodes of the augmented operator;
+    # A (S, 3, 3), b (S, 3), z0 (S, 3), tau (T,) elapsed days, out (S, T, 3)
+    M, r = _augmented(A, b)
+    w, V = np.linalg.eig(M)
+    cond = np.linalg.cond(V)
+    ok = np.isfinite(cond) & (cond < 1e10)
+
+    if ok.any():
+        y0 = np.stack([z0[ok, 1], z0[ok, 2], np.ones(ok.sum())], axis=-1)
+        c = np.linalg.solve(V[ok], y0[..., None])[..., 0]
+        w_ok, V_ok = w[ok], V[ok]
+
+        # exp(w tau) and its integral over [0, tau] (tau itself where w == 0) from one expm1
+        growth = np.expm1(w_ok[:, None, :] * tau[None, :, None])
+        small = np.abs(w_ok) < 1e-14
+        integral = np.where(small[:, None, :], tau[None, :, None], growth / np.where(small, 1.0, w_ok)[:, None, :])
+        growth += 1.0
+        growth *= c[:, None, :]
+
+        rVc = (np.einsum('si,sij->sj', r[ok], V_ok) * c)[..., None]
+        out[ok, :, 1:] = np.real(growth @ np.swapaxes(V_ok[:, :2, :], 1, 2))
+        out[ok, :, 0] = z0[ok, 0][:, None] + np.real(integral @ rVc)[..., 0]
+
+    for s in np.flatnonzero(~ok):
+        out[s] = _expm_solve(A[s], b[s], z0[s], tau)
+    return out
+
+
+def program_churn(f_incremental_churn_decrease, base=0.1):
+    # k_churn_prog of the notebook: the program removes f of the `base` annual churn
+    return annual_rate(base * (1 - np.asarray(f_incremental_churn_decrease, dtype=np.float64)))
+
+
+def _stack(params):
+    # mapping of name -> scalar or (S,) -> (S, 6); Q_in and k_churn are required, other rates
+    # default to 0, and f_incremental_churn_decrease may stand in for k_churn_prog
+    params = dict(params)
+    if 'f_incremental_churn_decrease' in params:
+        assert ('k_churn_prog' not in params), 'give k_churn_prog or f_incremental_churn_decrease, not both'
+        params['k_churn_prog'] = program_churn(params.pop('f_incremental_churn_decrease'))
+    assert (set(params) <= set(PARAMETERS)), f'unknown parameters {sorted(set(params) - set(PARAMETERS))}'
+    assert ({'Q_in', 'k_churn'} <= set(params)), 'Q_in and k_churn are required'
+    size = max(np.size(v) for v in params.values())
+    return np.stack([np.broadcast_to(np.asarray(params.get(name, 0.0), dtype=np.float64), (size,))
+                     for name in PARAMETERS], axis=-1)
+
+
+def sweep(params, z0, t, chunk=4096, dtype=np.float64, out=None):
+    # integrate many parameter sets together: params is (S, 6) in PARAMETERS order or a
+    # mapping of name -> (S,) arrays, see _stack; z0 is (3,) or (S, 3).
+    # returns (S, len(t), 3); scenarios are processed `chunk` at a time to bound temporaries
+    if isinstance(params, dict):
+        params = _stack(params)
+    params = np.atleast_2d(np.asarray(params, dtype=np.float64))
+    S = params.shape[0]
+    z0 = np.broadcast_to(np.asarray(z0, dtype=np.float64), (S, 3))
+    t = np.asarray(t, dtype=np.float64)
+    tau = t - t[0]
+
+    if out is None:
+        out = np.empty((S, len(t), 3), dtype=dtype)
+    A, b = _operators(params)
+    # float64 outputs are written in place, others through one float64 chunk buffer
+    buffer = None if out.dtype == np.float64 else np.empty((min(chunk, S), len(t), 3))
+    for start in range(0, S, chunk):
+        stop = min(start + chunk, S)
+        part = out[start:stop] if buffer is None else buffer[:stop - start]
+        _closed_form(A[start:stop], b[start:stop], z0[start:stop], tau, part)
+        if buffer is not None:
+            out[start:stop] = part
+    return out
+
+
+@dataclass(frozen=True)
+class ChurnModel:
+    # membership mass balance from the churn notebook, z = [book, available, program]
+    #   d(book)/dt      = Q_in - k_churn*avail - k_churn_prog*prog
+    #   d(avail)/dt     = Q_in - k_avail_prog*f_prog*avail + k_prog_avail*prog - k_churn*avail - k_churn_prog*prog
+    #   d(prog)/dt      = k_avail_prog*f_prog*avail - k_prog_avail*prog - k_churn_prog*prog
+    Q_in: float
+    k_churn: float
+    k_churn_prog: float = 0.0
+    k_avail_prog: float = 0.0
+    k_prog_avail: float = 0.0
+    f_prog: float = 0.0
+
+    def __post_init__(self):
+        # dz/dt = A z + b, built once and reused by every RHS / Jacobian call; the model is
+        # frozen so the rates cannot drift from A and b (use dataclasses.replace to change one)
+        A, b = _operators(self.params)
+        object.__setattr__(self, 'A', A)
+        object.__setattr__(self, 'b', b)
+        object.__setattr__(self, '_dz', np.empty(3))
+
+    @property
+    def params(self):
+        return np.array([getattr(self, name) for name in PARAMETERS], dtype=np.float64)
+
+    def rhs(self, z, t):
+        # odeint signature, writes into a preallocated buffer
+        np.dot(self.A, z, out=self._dz)
+        np.add(self._dz, self.b, out=self._dz)
+        return self._dz
+
+    def jacobian(self, z, t):
+        return self.A
+
+    def solve(self, z0, t, method='expm'):
+        # trajectory of shape (len(t), 3) at times t (days, t[0] is the start)
+        z0 = np.asarray(z0, dtype=np.float64)
+        t = np.asarray(t, dtype=np.float64)
+
+        if method == 'odeint':
+            return odeint(self.rhs, z0, t, Dfun=self.jacobian)
+        if method != 'expm':
+            # stiff integrators from solve_ivp (BDF, Radau, LSODA) with the exact Jacobian; as a
+            # callable, since LSODA tests the truth value of jac
+            sol = solve_ivp(lambda s, z: self.A @ z + self.b, (t[0], t[-1]), z0, method=method,
+                            t_eval=t, jac=lambda s, z: self.A, rtol=1e-10, atol=1e-8)
+            return sol.y.T
+
+        return _closed_form(self.A[None], self.b[None], z0[None], t - t[0], np.empty((1, len(t), 3)))[0]
+
+    def solve_schedule(self, z0, t, schedules):
+        # trajectory with time-varying inputs: schedules maps parameter names to Schedules
+        # (e.g. seasonal Q_in, phased k_avail_prog) replacing the constants. each constant
+        # segment is solved exactly in closed form from the state the previous one ended in
+        z = np.asarray(z0, dtype=np.float64)
+        t = np.asarray(t, dtype=np.float64)
+        assert (set(schedules) <= set(PARAMETERS)), 'schedules name model parameters'
+        edges = breakpoints(schedules.values(), t[0], t[-1])
+
+        params = np.tile(self.params, (edges.size - 1, 1))
+        for name, schedule in schedules.items():
+            params[:, PARAMETERS.index(name)] = schedule(edges[:-1])
+        A, b = _operators(params)
+
+        out = np.empty((t.size, 3))
+        first = np.searchsorted(t, edges, side='left')
+        first[-1] = t.size
+        for i in range(edges.size - 1):
+            rows = slice(first[i], first[i + 1])
+            tau = np.append(t[rows] - edges[i], edges[i + 1] - edges[i])
+            segment = _closed_form(A[i:i + 1], b[i:i + 1], z[None], tau, np.empty((1, tau.size, 3)))[0]
+            out[rows] = segment[:-1]
+            z = segment[-1]
+        return out
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+
+
+def discount_factors(t, rate=0.0, periods_per_year=1):
+    # (1 + rate)^-(t / periods_per_year); t in periods, the start is undiscounted
+    return (1.0 + rate) ** (-np.asarray(t, dtype=np.float64) / periods_per_year)
+
+
+@dataclass
+class CostEvaluation:
+    # per scenario (and cost scenario when crossed) and period
+    per_period: np.ndarray
+    discounted: np.ndarray
+    mcs: np.ndarray
+    table: pd.DataFrame
+
+
+def evaluate(trajectories, costs, rate=0.0, periods_per_year=1, t=None, time_axis=-2, cross=False):
+    # costs of state trajectories. trajectories are (S, T, k) or (T, k) with time on
+    # time_axis (0 for TransferMatrixModel.propagate's (T, C, k)); costs are (k,) shared
+    # or (S, k) paired with the trajectory scenarios, or (C, k) crossed with every
+    # trajectory scenario when cross=True -> (S, C, T). mcs is the notebook's
+    # (state_t - state_0) . cost, the cost change against the starting state
+    x = np.moveaxis(np.asarray(trajectories, dtype=np.float64), time_axis, -2)
+    c = np.asarray(costs, dtype=np.float64)
+    assert (x.shape[-1] == c.shape[-1]), 'one cost per state'
+
+    if cross:
+        # one GEMM over every (scenario, period) row against every cost scenario
+        assert (c.ndim == 2), 'cost scenarios are (C, k)'
+        per_period = np.moveaxis((x @ c.T), -1, -2)
+    elif c.ndim == 1:
+        per_period = x @ c
+    else:
+        assert (x.ndim == 3 and x.shape[0] == c.shape[0]), 'one cost vector per scenario'
+        per_period = (x @ c[:, :, None])[..., 0]
+
+    T = per_period.shape[-1]
+    factors = discount_factors(np.arange(T) if t is None else t, rate, periods_per_year)
+    discounted = per_period * factors
+    mcs = per_period - per_period[..., :1]
+
+    columns = {
+        'cost': per_period.sum(axis=-1),
+        'discounted_cost': discounted.sum(axis=-1),
+        'mcs': mcs[..., -1],
+        'cumulative_mcs': mcs.sum(axis=-1),
+        'discounted_mcs': (mcs * factors).sum(axis=-1),
+    }
+    shape = per_period.shape[:-1]
+    if len(shape) == 0:
+        table = pd.DataFrame({key: [value] for key, value in columns.items()})
+    else:
+        # a single (T, k) trajectory crossed with cost scenarios leaves only the cost axis
+        names = ['scenario', 'cost_scenario'][-len(shape):] if cross else ['scenario']
+        index = pd.MultiIndex.from_product([range(n) for n in shape], names=names) if len(shape) > 1 \
+            else pd.RangeIndex(shape[0], name=names[0])
+        table = pd.DataFrame({key: value.reshape(-1) for key, value in columns.items()}, index=index)
+    return CostEvaluation(per_period, discounted, mcs, table)
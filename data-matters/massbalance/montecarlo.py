@@ -0,0 +1,141 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .churn import PARAMETERS, sweep
+
+
+# samples per shard; fixed so results do not depend on the worker count
+SHARD = 4096
+
+# program parameters switched off for the counterfactual "without program" run, as in the churn notebook
+WITHOUT_PROGRAM = {'k_churn_prog': 0.0, 'k_avail_prog': 0.0, 'k_prog_avail': 0.0, 'f_prog': 0.0}
+
+
+def draw(priors, n, rng):
+    # (n, 6) parameter samples in PARAMETERS order; a prior is a constant or a frozen
+    # scipy.stats distribution, missing parameters are 0
+    params = np.zeros((n, len(PARAMETERS)))
+    for i, name in enumerate(PARAMETERS):
+        prior = priors.get(name, 0.0)
+        params[:, i] = prior.rvs(size=n, random_state=rng) if hasattr(prior, 'rvs') else prior
+    return params
+
+
+def _attach(name, shape):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+def _shard(args):
+    # draws and integrates samples [start, stop); writes into the shared (or local) output arrays
+    priors, z0, t, counterfactual, z0_counterfactual, seed, start, stop, outputs = args
+    rng = np.random.default_rng(seed)
+    params = draw(priors, stop - start, rng)
+
+    handles = []
+    arrays = dict()
+    for key, (target, shape) in outputs.items():
+        if isinstance(target, str):
+            shm, target = _attach(target, shape)
+            handles.append(shm)
+        arrays[key] = target
+
+    try:
+        arrays['params'][start:stop] = params
+        trajectories = sweep(params, z0, t, out=arrays['trajectories'][start:stop])
+        if counterfactual is not None:
+            params[:, [PARAMETERS.index(name) for name in counterfactual]] = list(counterfactual.values())
+            book = sweep(params, z0_counterfactual, t)[..., 0]
+            np.subtract(trajectories[..., 0], book, out=arrays['incremental'][start:stop])
+            final = arrays['incremental'][start:stop, -1].copy()
+        else:
+            final = trajectories[:, -1, 0].copy()
+    finally:
+        for shm in handles:
+            shm.close()
+    return start, stop, final
+
+
+@dataclass
+class MonteCarloResult:
+    t: np.ndarray
+    params: np.ndarray
+    trajectories: np.ndarray
+    incremental: np.ndarray
+
+    def bands(self, q=(2.5, 50, 97.5), field=None):
+        # percentile bands over time, shape (len(q), len(t)); field 'incremental' or a
+        # compartment of the program run ('book', 'avail', 'prog'). defaults to 'incremental',
+        # or 'book' for a run without a counterfactual
+        if field is None:
+            field = 'incremental' if len(self.incremental) else 'book'
+        assert (field != 'incremental' or len(self.incremental)), 'no incremental membership without a counterfactual'
+        values = self.incremental if field == 'incremental' else self.trajectories[..., ('book', 'avail', 'prog').index(field)]
+        return np.percentile(values, q, axis=0)
+
+
+class MonteCarlo:
+    # uncertainty propagation for the churn model: parameters drawn from priors, every
+    # sample integrated in closed form, incremental membership measured against the
+    # same draw with the program switched off
+
+    def __init__(self, priors, z0, t, counterfactual=WITHOUT_PROGRAM, z0_counterfactual=None):
+        self.priors = priors
+        self.z0 = np.asarray(z0, dtype=np.float64)
+        self.t = np.asarray(t, dtype=np.float64)
+        self.counterfactual = counterfactual
+        if z0_counterfactual is None:
+            # no one in the program: everyone in the book is available
+            z0_counterfactual = [self.z0[0], self.z0[0], 0.0]
+        self.z0_counterfactual = np.asarray(z0_counterfactual, dtype=np.float64)
+
+    def run(self, n, seed=0, workers=None, q=(2.5, 50, 97.5), progress=None):
+        # progress(done, quantiles) is called as shards finish, with running quantiles of
+        # the final incremental membership (final book without a counterfactual)
+        shapes = {'params': (n, len(PARAMETERS)), 'trajectories': (n, len(self.t), 3), 'incremental': (n, len(self.t))}
+        if self.counterfactual is None:
+            shapes['incremental'] = (0, len(self.t))
+
+        bounds = [(start, min(start + SHARD, n)) for start in range(0, n, SHARD)]
+        seeds = np.random.SeedSequence(seed).spawn(len(bounds))
+        workers = min(workers or os.cpu_count() or 1, len(bounds))
+        finals = []
+
+        def report(final, done):
+            # the finals of finished shards are few next to the trajectories kept in memory
+            finals.append(final)
+            if progress is not None:
+                progress(done, list(np.percentile(np.concatenate(finals), q)))
+
+        def tasks(outputs):
+            return [(self.priors, self.z0, self.t, self.counterfactual, self.z0_counterfactual, child, start, stop, outputs)
+                    for child, (start, stop) in zip(seeds, bounds)]
+
+        if workers <= 1:
+            arrays = {key: np.empty(shape) for key, shape in shapes.items()}
+            for task in tasks({key: (arrays[key], shape) for key, shape in shapes.items()}):
+                start, stop, final = _shard(task)
+                report(final, stop)
+            return MonteCarloResult(self.t, **arrays)
+
+        # workers write straight into shared memory; only the final values travel back
+        blocks = {key: shared_memory.SharedMemory(create=True, size=max(8, int(np.prod(shape)) * 8))
+                  for key, shape in shapes.items()}
+        try:
+            done = 0
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_shard, task) for task in tasks({key: (blocks[key].name, shape) for key, shape in shapes.items()})]
+                for future in as_completed(futures):
+                    start, stop, final = future.result()
+                    done += stop - start
+                    report(final, done)
+            arrays = {key: np.ndarray(shape, dtype=np.float64, buffer=blocks[key].buf).copy() for key, shape in shapes.items()}
+        finally:
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+        return MonteCarloResult(self.t, **arrays)
@@ -0,0 +1,47 @@
+import numpy as np
+from dataclasses import dataclass
+
+
+@dataclass
+class Schedule:
+    # piecewise-constant curve: values[i] holds on [times[i], times[i + 1]), values[0]
+    # also before times[0] and values[-1] after the last change
+    times: np.ndarray
+    values: np.ndarray
+
+    def __post_init__(self):
+        times = np.asarray(self.times, dtype=np.float64)
+        values = np.asarray(self.values, dtype=np.float64)
+        assert (times.ndim == 1 and times.shape == values.shape), 'one value per change time'
+        assert (np.diff(times) > 0).all(), 'change times increase'
+        setattr(self, 'times', times)
+        setattr(self, 'values', values)
+
+    @classmethod
+    def constant(cls, value):
+        return cls([0.0], [value])
+
+    @classmethod
+    def tabulated(cls, t, values):
+        # samples of a curve such as Q_new(t), each held until the next sample
+        return cls(t, values)
+
+    @classmethod
+    def periodic(cls, values, period=365, horizon=3650, start=0.0):
+        # seasonal pattern of len(values) equal steps per period (e.g. 12 monthly inflows),
+        # repeated from start until horizon
+        values = np.asarray(values, dtype=np.float64)
+        step = period / values.size
+        n = int(np.ceil((horizon - start) / step))
+        return cls(start + step * np.arange(n), np.resize(values, n))
+
+    def __call__(self, t):
+        at = np.searchsorted(self.times, t, side='right') - 1
+        return self.values[np.clip(at, 0, self.values.size - 1)]
+
+
+def breakpoints(schedules, start, stop):
+    # segment edges: start, stop and every change time of any schedule between them
+    times = np.concatenate([[start, stop]] + [s.times for s in schedules])
+    times = np.unique(times)
+    return times[(times >= start) & (times <= stop)]
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from scipy.integrate import odeint
+
+from ..churn import PARAMETERS, ChurnModel, annual_rate, program_churn, sweep
+from ..schedule import Schedule
+
+
+# the churn notebook's "with program" rates
+NOTEBOOK = dict(Q_in=10_000 / 365, k_churn=annual_rate(0.5), k_churn_prog=program_churn(0.1),
+                k_avail_prog=annual_rate(0.5), k_prog_avail=annual_rate(0.05), f_prog=1.0)
+Z0 = np.array([10_000.0, 10_000.0, 0.0])
+T = np.linspace(0, 3650, 121)
+
+
+def reference(params, z0, t):
+    # the notebook's right hand side integrated with odeint
+    Q_in, k_churn, k_churn_prog, k_avail_prog, k_prog_avail, f_prog = params
+
+    def rhs(z, t):
+        return [Q_in - k_churn * z[1] - k_churn_prog * z[2],
+                Q_in - k_avail_prog * z[1] * f_prog + k_prog_avail * z[2] - k_churn * z[1] - k_churn_prog * z[2],
+                k_avail_prog * z[1] * f_prog - k_prog_avail * z[2] - k_churn_prog * z[2]]
+    return odeint(rhs, z0, t, rtol=1e-12, atol=1e-9)
+
+
+def close(a, b, rtol=1e-6):
+    np.testing.assert_allclose(a, b, rtol=rtol, atol=rtol * np.abs(b).max())
+
+
+@pytest.mark.parametrize('method', ['expm', 'odeint', 'LSODA', 'BDF', 'Radau'])
+def test_solve_matches_odeint(method):
+    model = ChurnModel(**NOTEBOOK)
+    close(model.solve(Z0, T, method=method), reference(model.params, Z0, T), rtol=1e-5)
+
+
+def test_solve_without_program():
+    model = ChurnModel(Q_in=NOTEBOOK['Q_in'], k_churn=NOTEBOOK['k_churn'])
+    close(model.solve(Z0, T), reference(model.params, Z0, T))
+
+
+def test_sweep_matches_odeint():
+    rng = np.random.default_rng(0)
+    params = np.tile(ChurnModel(**NOTEBOOK).params, (8, 1)) * rng.uniform(0.5, 1.5, (8, len(PARAMETERS)))
+    params[0, 2:] = 0.0
+    out = sweep(params, Z0, T)
+    assert out.shape == (8, T.size, 3)
+    for p, trajectory in zip(params, out):
+        close(trajectory, reference(p, Z0, T))
+    close(sweep(params, Z0, T, chunk=3, dtype=np.float32), out, rtol=1e-5)
+
+
+def test_sweep_mapping():
+    mapping = {name: value for name, value in NOTEBOOK.items() if name != 'k_churn_prog'}
+    out = sweep(dict(mapping, f_incremental_churn_decrease=[0.0, 0.5]), Z0, T)
+    assert not np.allclose(out[0], out[1])
+    close(out[1], ChurnModel(**dict(NOTEBOOK, k_churn_prog=program_churn(0.5))).solve(Z0, T))
+
+    for bad in [dict(NOTEBOOK, typo=1.0), {'Q_in': 1.0}]:
+        with pytest.raises(AssertionError):
+            sweep(bad, Z0, T)
+
+
+def test_solve_schedule_matches_stepping():
+    model = ChurnModel(**NOTEBOOK)
+    schedules = {'Q_in': Schedule.periodic([20.0, 40.0, 25.0, 30.0], period=365, horizon=3650),
+                 'k_avail_prog': Schedule([0.0, 400.0], [0.0, NOTEBOOK['k_avail_prog']])}
+    out = model.solve_schedule(Z0, T, schedules)
+
+    # odeint segment by segment between change times
+    edges = np.unique(np.concatenate([T, schedules['Q_in'].times, schedules['k_avail_prog'].times]))
+    edges = edges[edges <= T[-1]]
+    z, states = Z0, {0.0: Z0}
+    for a, b in zip(edges[:-1], edges[1:]):
+        params = model.params.copy()
+        for name, schedule in schedules.items():
+            params[PARAMETERS.index(name)] = schedule(a)
+        z = reference(params, z, [a, b])[-1]
+        states.update({b: z})
+    close(out, np.array([states[t] for t in T]))
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from ..transfer import TransferMatrixModel
+
+
+def transfer(k=5, seed=0):
+    # random column-stochastic matrix
+    T = np.random.default_rng(seed).uniform(size=(k, k))
+    return T / T.sum(axis=0)
+
+
+def stepped(T, state, periods):
+    states = [np.asarray(state, dtype=np.float64)]
+    for _ in range(periods):
+        states.append(states[-1] @ T.T)
+    return np.array(states)
+
+
+def test_state_matches_stepping():
+    T = transfer()
+    state = np.arange(1.0, 6.0)
+    model = TransferMatrixModel(T)
+    expected = stepped(T, state, 40)
+    horizons = np.array([0, 1, 7, 40, 3])
+    np.testing.assert_allclose(model.state(state, horizons), expected[horizons], rtol=1e-10)
+    np.testing.assert_allclose(model.state(state[:, None], 7), expected[7], rtol=1e-10)
+    np.testing.assert_allclose(model.trajectory(state, 40), expected, rtol=1e-10)
+
+
+def test_defective_and_sparse_match_stepping():
+    # a Jordan block has no eigenbasis and is solved by repeated squaring
+    T = np.array([[0.5, 0.0, 0.0], [0.5, 0.5, 0.0], [0.0, 0.5, 1.0]])
+    state = np.array([1.0, 2.0, 3.0])
+    expected = stepped(T, state, 20)
+    for model in (TransferMatrixModel(T), TransferMatrixModel(sparse.csr_matrix(T))):
+        np.testing.assert_allclose(model.state(state, [20, 5, 0]), expected[[20, 5, 0]], rtol=1e-10)
+        np.testing.assert_allclose(model.propagate(state, 20), expected, rtol=1e-10)
+    assert TransferMatrixModel(T).defective
+
+
+def test_cohorts_and_stacks_match_stepping():
+    states = np.random.default_rng(1).uniform(size=(3, 5))
+    T = transfer()
+    out = TransferMatrixModel(T).propagate(states, 12, dtype=np.float32)
+    for c in range(3):
+        np.testing.assert_allclose(out[:, c], stepped(T, states[c], 12), rtol=1e-5)
+
+    stack = np.stack([transfer(seed=s) for s in range(3)])
+    model = TransferMatrixModel(stack)
+    for c in range(3):
+        expected = stepped(stack[c], states[c], 12)
+        np.testing.assert_allclose(model.propagate(states, 12)[:, c], expected, rtol=1e-10)
+        np.testing.assert_allclose(model.state(states, 12)[c], expected[12], rtol=1e-10)
+
+
+@pytest.mark.parametrize('method', ['direct', 'power', 'eigs'])
+def test_steady_state_matches_stepping(method):
+    T = transfer()
+    state = np.arange(1.0, 6.0)
+    model = TransferMatrixModel(sparse.csr_matrix(T) if method == 'eigs' else T)
+    result = model.steady_state(state, method=method)
+    limit = stepped(T, state, 500)[-1]
+    assert result.converged
+    np.testing.assert_allclose(result.state, limit, rtol=1e-8)
+    np.testing.assert_allclose(result.distribution, limit / limit.sum(), rtol=1e-8)
+    if method != 'eigs':
+        # within tol after `periods` steps
+        steps = stepped(T, state, result.periods)
+        assert np.abs(steps[-1] - limit).sum() <= 1e-9 * state.sum()
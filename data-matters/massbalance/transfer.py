@@ -0,0 +1,257 @@
+import numpy as np
+from dataclasses import dataclass
+from scipy import sparse
+from scipy.sparse.linalg import eigs
+
+
+def _apply(P, x):
+    # P applied to every state in x (..., k); P is one (k, k) matrix or a (C, k, k) stack
+    # paired with the cohort axis of x (..., C, k)
+    if sparse.issparse(P):
+        return (P @ x.T).T
+    if P.ndim == 2:
+        return x @ P.T
+    return (P @ x[..., None])[..., 0]
+
+
+# largest dense model solved from its eigenbasis by steady_state(method='auto')
+DIRECT_MAX = 500
+
+
+@dataclass
+class SteadyState:
+    state: np.ndarray
+    distribution: np.ndarray
+    periods: int
+    converged: bool
+    residual: float
+    method: str
+
+
+@dataclass
+class TransferMatrixModel:
+    # discrete case-flow model from the transfer matrix notebook: state_{n+1} = T state_n.
+    # T is factorized once, T = V diag(w) V^-1, so any horizon costs one scaled product.
+    # T is (k, k), a (C, k, k) stack with one matrix per cohort, or a scipy sparse matrix
+    # for large pathway graphs (stepped with sparse mat-vecs, never factorized densely);
+    # states are (k,) or (C, k)
+    transfer_matrix: np.ndarray
+    max_cond: float = 1e10
+    nodes: list = None
+
+    def __post_init__(self):
+        if sparse.issparse(self.transfer_matrix):
+            T = sparse.csr_matrix(self.transfer_matrix, dtype=np.float64)
+            assert (T.shape[0] == T.shape[1]), 'transfer matrix is square'
+            setattr(self, 'transfer_matrix', T)
+            for name in ('eigenvalues', 'eigenvectors', '_inverse'):
+                setattr(self, name, None)
+            setattr(self, 'defective', False)
+            return
+
+        T = np.asarray(self.transfer_matrix, dtype=np.float64)
+        assert (T.ndim in (2, 3) and T.shape[-1] == T.shape[-2]), 'transfer matrix is square'
+        setattr(self, 'transfer_matrix', T)
+
+        w, V = np.linalg.eig(T)
+        cond = np.linalg.cond(V)
+        setattr(self, 'eigenvalues', w)
+        setattr(self, 'eigenvectors', V)
+        # (nearly) defective matrices have no usable eigenbasis, fall back to repeated squaring
+        setattr(self, 'defective', not (np.isfinite(cond) & (cond < self.max_cond)).all())
+        setattr(self, '_inverse', None if self.defective else np.linalg.inv(V))
+        setattr(self, '_squares', [T])
+
+    @classmethod
+    def from_edges(cls, edges, nodes=None, retain=False, **kwargs):
+        # sparse model from (source, target, fraction) edges, e.g. the notebook's Digraph
+        # edges with weights. column `source` of T holds the fractions leaving it; with
+        # retain, whatever does not leave a node stays there (the diagonal)
+        edges = list(edges)
+        if nodes is None:
+            nodes = list(dict.fromkeys(node for source, target, _ in edges for node in (source, target)))
+        slot = {node: i for i, node in enumerate(nodes)}
+        k = len(nodes)
+
+        sources = np.array([slot[source] for source, _, _ in edges], dtype=np.int64)
+        targets = np.array([slot[target] for _, target, _ in edges], dtype=np.int64)
+        fractions = np.array([fraction for _, _, fraction in edges], dtype=np.float64)
+        if retain:
+            stay = 1.0 - np.bincount(sources, weights=fractions, minlength=k)
+            sources = np.concatenate([sources, np.arange(k)])
+            targets = np.concatenate([targets, np.arange(k)])
+            fractions = np.concatenate([fractions, stay])
+        # duplicate (target, source) pairs are summed by the conversion
+        T = sparse.coo_matrix((fractions, (targets, sources)), shape=(k, k)).tocsr()
+        T.eliminate_zeros()
+        return cls(T, nodes=list(nodes), **kwargs)
+
+    @property
+    def is_sparse(self):
+        return sparse.issparse(self.transfer_matrix)
+
+    @property
+    def size(self):
+        return self.transfer_matrix.shape[-1]
+
+    @property
+    def stacked(self):
+        return not self.is_sparse and self.transfer_matrix.ndim == 3
+
+    def _state(self, current_state):
+        # (k,), a (k, 1) column as in the notebook's np.matrix, or (C, k) cohorts
+        state = np.asarray(current_state, dtype=np.float64)
+        if state.ndim == 2 and state.shape == (self.size, 1):
+            state = state[:, 0]
+        assert (state.ndim in (1, 2) and state.shape[-1] == self.size), 'state matches transfer matrix'
+        if self.stacked:
+            assert (state.ndim == 2 and state.shape[0] == self.transfer_matrix.shape[0]), 'one state per cohort matrix'
+        return state
+
+    def _square(self, j):
+        # T^(2^j), built on demand and kept
+        while len(self._squares) <= j:
+            self._squares.append(self._squares[-1] @ self._squares[-1])
+        return self._squares[j]
+
+    def _powers(self, state, horizons):
+        # exponentiation by squaring for every horizon at once: one batched product per bit
+        out = np.repeat(state[None], horizons.size, axis=0)
+        remaining = horizons.copy()
+        j = 0
+        while remaining.any():
+            odd = (remaining & 1).astype(bool)
+            if odd.any():
+                out[odd] = _apply(self._square(j), out[odd])
+            remaining >>= 1
+            j += 1
+        return out
+
+    def state(self, current_state, horizons):
+        # state after n periods; horizons is an int or an array of ints -> horizons.shape + state.shape
+        state = self._state(current_state)
+        n = np.asarray(horizons, dtype=np.int64)
+        assert (n >= 0).all(), 'horizons are non negative'
+        flat = n.reshape(-1)
+
+        if self.is_sparse:
+            # squaring a sparse matrix fills it in; step with mat-vecs up to the longest horizon
+            out = np.empty((flat.size,) + state.shape)
+            order = np.argsort(flat, kind='stable')
+            step = 0
+            for i in order:
+                for _ in range(flat[i] - step):
+                    state = _apply(self.transfer_matrix, state)
+                step = flat[i]
+                out[i] = state
+        elif self.defective:
+            out = self._powers(state, flat)
+        else:
+            coefficients = _apply(self._inverse, state)
+            growth = self.eigenvalues ** flat.reshape((-1,) + (1,) * self.eigenvalues.ndim)
+            if state.ndim == 2 and not self.stacked:
+                growth = growth[:, None, :]
+            out = np.real(_apply(self.eigenvectors, growth * coefficients))
+        return out.reshape(n.shape + state.shape)
+
+    def trajectory(self, current_state, periods):
+        # states after 0, 1, ..., periods steps -> (periods + 1,) + state.shape
+        if self.is_sparse or self.defective:
+            return self.propagate(current_state, periods)
+        return self.state(current_state, np.arange(periods + 1))
+
+    def propagate(self, current_state, periods, dtype=np.float64, out=None):
+        # step every cohort `periods` times, writing into a preallocated (periods + 1, C, k)
+        # buffer: one GEMM per step for a shared matrix, one batched matmul for a stack
+        state = self._state(current_state)
+        if out is None:
+            out = np.empty((periods + 1,) + state.shape, dtype=dtype)
+        assert (out.shape == (periods + 1,) + state.shape), 'output buffer matches trajectory'
+
+        T = self.transfer_matrix.astype(out.dtype, copy=False)
+        out[0] = state
+        if self.is_sparse:
+            for i in range(periods):
+                out[i + 1] = _apply(T, out[i])
+        elif self.stacked:
+            for i in range(periods):
+                np.matmul(T, out[i][..., None], out=out[i + 1][..., None])
+        else:
+            Tt = T.T
+            for i in range(periods):
+                np.matmul(out[i], Tt, out=out[i + 1])
+        return out
+
+    def validate(self, tol=1e-8):
+        # the notebook's convention: entries are fractions and each column sums to 1
+        T = self.transfer_matrix
+        if self.is_sparse:
+            sums, smallest = np.asarray(T.sum(axis=0)).ravel(), T.data.min(initial=0.0)
+        else:
+            sums, smallest = T.sum(axis=-2), T.min()
+        assert (smallest >= -tol), 'transfer fractions are non negative'
+        assert (np.abs(sums - 1.0) <= tol).all(), 'each column of the transfer matrix sums to 1'
+        return self
+
+    def _limit(self, state, tol, max_periods):
+        # exact limit from the eigenbasis: the modes with eigenvalue 1 survive, the rest
+        # decay as w^n; periods is the first n with |state_n - limit|_1 <= tol * mass
+        w, V = self.eigenvalues, self.eigenvectors
+        coefficients = self._inverse @ state
+        unit = np.abs(w - 1.0) <= 1e-12
+        assert (np.abs(w[~unit]) < 1.0).all(), 'transfer matrix has a steady state'
+        limit = np.real(V[:, unit] @ coefficients[unit])
+
+        mass = max(np.abs(state).sum(), np.finfo(float).tiny)
+        decaying = V[:, ~unit] * coefficients[~unit]
+        for first in range(0, max_periods + 1, 1024):
+            n = np.arange(first, min(first + 1024, max_periods + 1))
+            error = np.abs(np.real((w[~unit] ** n[:, None]) @ decaying.T)).sum(axis=1) / mass
+            below = np.flatnonzero(error <= tol)
+            if below.size:
+                return limit, int(n[below[0]]), float(error[below[0]])
+        return limit, None, float(error[-1])
+
+    def _iterate(self, state, tol, max_periods):
+        # power iteration, stopping once successive states differ by at most tol * mass
+        mass = max(np.abs(state).sum(), np.finfo(float).tiny)
+        change = np.inf
+        for n in range(max_periods):
+            following = _apply(self.transfer_matrix, state)
+            change = np.abs(following - state).sum() / mass
+            state = following
+            if change <= tol:
+                return state, n + 1, float(change)
+        return state, None, float(change)
+
+    def steady_state(self, current_state=None, tol=1e-10, max_periods=100_000, method='auto', check=True):
+        # asymptote reached from current_state (uniform over states by default) and the
+        # number of periods to get within tol of it. 'direct' projects onto the eigenvalue-1
+        # modes of the cached factorization (small dense models), 'power' steps until the
+        # state stops changing (large or sparse models), 'eigs' takes the dominant eigenvector
+        # from ARPACK (sparse models with a unique stationary distribution, no periods)
+        assert (not self.stacked), 'one transfer matrix'
+        if check:
+            self.validate()
+        state = np.full(self.size, 1.0 / self.size) if current_state is None else self._state(current_state)
+        assert (state.ndim == 1), 'one state'
+
+        if method == 'auto':
+            method = 'direct' if not self.is_sparse and not self.defective and self.size <= DIRECT_MAX else 'power'
+
+        if method == 'direct':
+            assert (not self.is_sparse and not self.defective), 'direct solve needs a dense eigenbasis'
+            limit, periods, residual = self._limit(state, tol, max_periods)
+        elif method == 'power':
+            limit, periods, residual = self._iterate(state, tol, max_periods)
+        else:
+            # dominant eigenvector only; ARPACK gives no time to converge
+            w, V = eigs(self.transfer_matrix, k=1, which='LM')
+            limit = np.real(V[:, 0])
+            limit = limit / limit.sum() * state.sum()
+            periods = None
+            residual = np.abs(_apply(self.transfer_matrix, limit) - limit).sum() / max(np.abs(limit).sum(), np.finfo(float).tiny)
+
+        total = limit.sum()
+        return SteadyState(state=limit, distribution=limit / total if total else limit, periods=periods,
+                           converged=periods is not None or residual <= tol, residual=residual, method=method)